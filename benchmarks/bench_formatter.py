@@ -0,0 +1,82 @@
+"""
+Micro-benchmark: Genie result formatting.
+
+Compares the original per-cell formatting loop from ask_genie with the per-column formatters in
+agents.genie_format on synthetic statement results.
+
+    python benchmarks/bench_formatter.py --rows 10000 --repeat 5
+"""
+import os
+import sys
+import random
+import argparse
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+from agents.genie_format import column_formatter, format_columns  # noqa: E402
+
+# (name, type_name, (type_scale, type_precision), value generator)
+COLUMNS = [
+    ("region", "STRING", (None, None), lambda r: r.choice(["North", "South", "East", "West"])),
+    ("order_date", "DATE", (None, None), lambda r: f"2024-{r.randint(1, 12):02d}-{r.randint(1, 28):02d}"),
+    ("updated_at", "TIMESTAMP", (None, None), lambda r: f"2024-05-{r.randint(1, 28):02d}T12:00:00.000Z"),
+    ("revenue", "DECIMAL", (2, 12), lambda r: f"{r.uniform(0, 1e7):.2f}"),
+    ("margin", "DOUBLE", (None, None), lambda r: repr(r.random())),
+    ("units", "BIGINT", (None, None), lambda r: str(r.randint(0, 10**9))),
+    ("balance", "DECIMAL", (4, 38), lambda r: f"{r.uniform(-1e12, 1e12):.4f}"),
+    ("is_returned", "BOOLEAN", (None, None), lambda r: r.choice(["true", "false"])),
+]
+
+
+def make_rows(count: int, null_ratio: float, seed: int) -> list[list]:
+    rnd = random.Random(seed)
+    return [
+        [None if rnd.random() < null_ratio else gen(rnd) for _, _, _, gen in COLUMNS]
+        for _ in range(count)
+    ]
+
+
+def legacy_format(rows: list[list], type_names: list[str]) -> list[list[str]]:
+    # The loop ask_genie used before genie_format, comparing type names per cell
+    formatted = []
+    for row in rows:
+        formatted_row = []
+        for value, type_name in zip(row, type_names):
+            if value is None:
+                formatted_value = "NULL"
+            elif type_name in ["DECIMAL", "DOUBLE", "FLOAT"]:
+                formatted_value = f"{float(value):,.2f}"
+            elif type_name in ["INT", "BIGINT", "LONG"]:
+                formatted_value = f"{int(value):,}"
+            else:
+                formatted_value = str(value)
+            formatted_row.append(formatted_value)
+        formatted.append(formatted_row)
+    return formatted
+
+
+def columnar_format(rows: list[list]) -> list[list[str]]:
+    formatters = [column_formatter(type_name, *type_info) for _, type_name, type_info, _ in COLUMNS]
+    return format_columns(rows, formatters)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--null-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    type_names = [type_name for _, type_name, _, _ in COLUMNS]
+    print(f"{'rows':>8} {'legacy ms':>12} {'columnar ms':>12} {'speedup':>8}")
+    for count in args.rows:
+        rows = make_rows(count, args.null_ratio, args.seed)
+        legacy = min(timeit.repeat(lambda: legacy_format(rows, type_names), number=1, repeat=args.repeat))
+        columnar = min(timeit.repeat(lambda: columnar_format(rows), number=1, repeat=args.repeat))
+        print(f"{count:>8} {legacy * 1000:>12.2f} {columnar * 1000:>12.2f} {legacy / columnar:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
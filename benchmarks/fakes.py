@@ -0,0 +1,428 @@
+"""
+Local stand-ins for the services a turn depends on, used by the load-test harness.
+
+- FakeBackend: one aiohttp server acting as the Entra ID token endpoint (OBO), the Bot Framework
+  token service and connector (user tokens and replies), and the Databricks Genie and statement
+  execution APIs, with configurable Genie latency and result size.
+- FakeAgent: a stand-in for the Foundry-hosted ChatAgent that calls the real Genie tool and answers
+  after a configurable model latency, optionally returning a chart image.
+- Blob stubs replacing the chart upload and URL functions in utils.
+
+The backend runs on its own event loop in a background thread so its work does not show up as
+event-loop lag in the app under test.
+"""
+import json
+import time
+import uuid
+import base64
+import random
+import asyncio
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from aiohttp import web
+
+from agent_framework import (
+    AgentRunResponse,
+    AgentRunResponseUpdate,
+    ChatMessage,
+    DataContent,
+    FunctionCallContent,
+    Role,
+    TextContent,
+    UsageContent,
+    UsageDetails,
+)
+
+TENANT_ID = "00000000-0000-0000-0000-000000000001"
+
+# 1x1 transparent PNG
+PNG_BYTES = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+
+def fake_jwt(oid: str, lifetime: int = 3600) -> str:
+    """
+    Unsigned JWT-shaped token carrying the claims the app reads (oid, tid, exp).
+    """
+    def encode(part: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(part).encode()).decode().rstrip("=")
+
+    claims = {"oid": oid, "tid": TENANT_ID, "exp": int(time.time()) + lifetime, "jti": uuid.uuid4().hex}
+    return f"{encode({'alg': 'none', 'typ': 'JWT'})}.{encode(claims)}.sig"
+
+
+def _claims(token: str) -> dict:
+    payload = token.split(".")[1]
+    return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+
+
+@dataclass
+class BackendOptions:
+    obo_latency: float = 0.05
+    genie_latency: float = 2.0
+    genie_api_latency: float = 0.02
+    result_rows: int = 200
+    chunk_rows: int = 10000
+    connector_latency: float = 0.01
+    # Issue every Databricks token for this one identity, like a shared service principal
+    shared_oid: Optional[str] = None
+
+
+@dataclass
+class BackendStats:
+    obo_exchanges: int = 0
+    user_tokens: int = 0
+    genie_questions: int = 0
+    genie_polls: int = 0
+    statement_fetches: int = 0
+    replies: int = 0
+    reply_texts: list = field(default_factory=list)
+
+
+class FakeBackend:
+    """
+    Entra ID, Bot Framework and Databricks stand-ins served from one local HTTP server.
+    """
+
+    def __init__(self, options: BackendOptions):
+        self.options = options
+        self.stats = BackendStats()
+        self.url = ""
+        self._messages: dict[str, dict] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    # --- Entra ID ---
+
+    async def obo_token(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.options.obo_latency)
+        form = await request.post()
+        self.stats.obo_exchanges += 1
+        oid = self.options.shared_oid or _claims(form["assertion"])["oid"]
+        return web.json_response({"token_type": "Bearer", "access_token": fake_jwt(oid), "expires_in": 3600})
+
+    # --- Bot Framework token service and connector ---
+
+    async def user_token(self, request: web.Request) -> web.Response:
+        self.stats.user_tokens += 1
+        return web.json_response({
+            "connectionName": request.query.get("connectionName"),
+            "token": fake_jwt(request.query["userId"]),
+            "expiration": "2099-01-01T00:00:00Z",
+            "channelId": request.query.get("channelId"),
+        })
+
+    async def reply(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.options.connector_latency)
+        activity = await request.json()
+        if activity.get("type") == "message":
+            self.stats.replies += 1
+            if activity.get("text"):
+                self.stats.reply_texts.append(activity["text"])
+        return web.json_response({"id": uuid.uuid4().hex})
+
+    # --- Databricks Genie and statement execution ---
+
+    def _new_message(self, space_id: str, conversation_id: str, content: str) -> dict:
+        message_id = uuid.uuid4().hex
+        self._messages[message_id] = {
+            "space_id": space_id,
+            "conversation_id": conversation_id,
+            "content": content,
+            "created": time.monotonic(),
+            "statement_id": uuid.uuid4().hex,
+        }
+        self.stats.genie_questions += 1
+        return self._message_json(message_id)
+
+    def _message_json(self, message_id: str) -> dict:
+        message = self._messages[message_id]
+        completed = time.monotonic() - message["created"] >= self.options.genie_latency
+        body = {
+            "id": message_id,
+            "message_id": message_id,
+            "space_id": message["space_id"],
+            "conversation_id": message["conversation_id"],
+            "content": message["content"],
+            "status": "COMPLETED" if completed else "EXECUTING_QUERY",
+        }
+        if completed:
+            body["attachments"] = [{"attachment_id": "a1", "query": {"query": "SELECT * FROM sales", "description": "Sales"}}]
+            body["query_result"] = {"statement_id": message["statement_id"], "row_count": self.options.result_rows}
+        return body
+
+    async def start_conversation(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.options.genie_api_latency)
+        body = await request.json()
+        conversation_id = uuid.uuid4().hex
+        message = self._new_message(request.match_info["space_id"], conversation_id, body["content"])
+        return web.json_response({
+            "conversation_id": conversation_id,
+            "message_id": message["id"],
+            "conversation": {"id": conversation_id, "space_id": message["space_id"], "title": body["content"]},
+            "message": message,
+        })
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.options.genie_api_latency)
+        body = await request.json()
+        message = self._new_message(request.match_info["space_id"], request.match_info["conversation_id"], body["content"])
+        return web.json_response(message)
+
+    async def get_message(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.options.genie_api_latency)
+        self.stats.genie_polls += 1
+        message_id = request.match_info["message_id"]
+        if message_id not in self._messages:
+            return web.json_response({"error_code": "NOT_FOUND", "message": "No such message"}, status=404)
+        return web.json_response(self._message_json(message_id))
+
+    async def query_result(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.options.genie_api_latency)
+        message = self._messages[request.match_info["message_id"]]
+        return web.json_response({"statement_response": {"statement_id": message["statement_id"], "status": {"state": "SUCCEEDED"}}})
+
+    def _chunk(self, index: int) -> dict:
+        rows = self.options.result_rows
+        start = index * self.options.chunk_rows
+        end = min(start + self.options.chunk_rows, rows)
+        rnd = random.Random(index)
+        chunk = {
+            "chunk_index": index,
+            "row_offset": start,
+            "row_count": end - start,
+            "data_array": [
+                [["North", "South", "East", "West"][i % 4], f"2024-{i % 12 + 1:02d}-01", f"{rnd.uniform(0, 1e6):.2f}", str(rnd.randint(0, 10000))]
+                for i in range(start, end)
+            ],
+        }
+        if end < rows:
+            chunk["next_chunk_index"] = index + 1
+        return chunk
+
+    async def get_statement(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.options.genie_api_latency)
+        self.stats.statement_fetches += 1
+        rows = self.options.result_rows
+        columns = [
+            {"name": "region", "type_name": "STRING", "type_text": "STRING", "position": 0},
+            {"name": "month", "type_name": "DATE", "type_text": "DATE", "position": 1},
+            {"name": "revenue", "type_name": "DECIMAL", "type_text": "DECIMAL(12,2)", "type_scale": 2, "type_precision": 12, "position": 2},
+            {"name": "units", "type_name": "BIGINT", "type_text": "BIGINT", "position": 3},
+        ]
+        return web.json_response({
+            "statement_id": request.match_info["statement_id"],
+            "status": {"state": "SUCCEEDED"},
+            "manifest": {
+                "format": "JSON_ARRAY",
+                "schema": {"column_count": len(columns), "columns": columns},
+                "total_row_count": rows,
+                "total_chunk_count": max(1, -(-rows // self.options.chunk_rows)),
+            },
+            "result": self._chunk(0),
+        })
+
+    async def get_chunk(self, request: web.Request) -> web.Response:
+        await asyncio.sleep(self.options.genie_api_latency)
+        return web.json_response(self._chunk(int(request.match_info["chunk_index"])))
+
+    async def not_found(self, request: web.Request) -> web.Response:
+        return web.json_response({"error_code": "NOT_FOUND"}, status=404)
+
+    def _app(self) -> web.Application:
+        app = web.Application()
+        genie = "/api/2.0/genie/spaces/{space_id}"
+        message = genie + "/conversations/{conversation_id}/messages/{message_id}"
+        app.router.add_post("/{tenant}/oauth2/v2.0/token", self.obo_token)
+        app.router.add_get("/api/usertoken/GetToken", self.user_token)
+        app.router.add_post("/v3/conversations/{conversation_id}/activities", self.reply)
+        app.router.add_post("/v3/conversations/{conversation_id}/activities/{activity_id}", self.reply)
+        app.router.add_put("/v3/conversations/{conversation_id}/activities/{activity_id}", self.reply)
+        app.router.add_post(genie + "/start-conversation", self.start_conversation)
+        app.router.add_post(genie + "/conversations/{conversation_id}/messages", self.create_message)
+        app.router.add_get(message, self.get_message)
+        app.router.add_get(message + "/query-result", self.query_result)
+        app.router.add_get("/api/2.0/sql/statements/{statement_id}", self.get_statement)
+        app.router.add_get("/api/2.0/sql/statements/{statement_id}/result/chunks/{chunk_index}", self.get_chunk)
+        app.router.add_get("/.well-known/databricks-config", self.not_found)
+        return app
+
+    def start(self) -> str:
+        """
+        Start the backend on a free local port in a background thread and return its base URL.
+        """
+        ready = threading.Event()
+
+        async def serve() -> None:
+            self._runner = web.AppRunner(self._app(), access_log=None)
+            await self._runner.setup()
+            site = web.TCPSite(self._runner, "127.0.0.1", 0)
+            await site.start()
+            port = self._runner.addresses[0][1]
+            self.url = f"http://127.0.0.1:{port}"
+            ready.set()
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(serve())
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-backend", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.url
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class FakeThread:
+    def __init__(self, service_thread_id: Optional[str] = None):
+        self.service_thread_id = service_thread_id or f"thread_{uuid.uuid4().hex}"
+
+
+class FakeAgent:
+    """
+    Stand-in for the Foundry-hosted agent: calls the real Genie tool once per question and answers
+    after model_latency seconds (split around the tool call), optionally with a chart image. With
+    fan_out > 1 it splits each question into that many sub-questions for the batched Genie tool.
+    Given chart_tool, charts are drawn with it from the Genie result's dataset instead.
+
+    Threads are tracked by size: each run reports the input tokens it read (thread so far plus the
+    new messages, read once before and once after the tool call) and takes context_latency seconds
+    longer per 1,000 of them.
+    """
+
+    def __init__(self, tool, model_latency: float = 1.0, chart: bool = False, text_chunks: int = 8,
+                 many_tool=None, fan_out: int = 1, chart_tool=None, context_latency: float = 0.0):
+        self.tool = tool
+        self.model_latency = model_latency
+        self.chart = chart
+        self.text_chunks = text_chunks
+        self.many_tool = many_tool
+        self.fan_out = fan_out
+        self.chart_tool = chart_tool
+        self.context_latency = context_latency
+        # Characters of text in each thread
+        self._thread_chars: dict[str, int] = {}
+
+    def get_new_thread(self, service_thread_id: Optional[str] = None) -> FakeThread:
+        return FakeThread(service_thread_id)
+
+    def _tool_call(self, question: str) -> tuple[Any, dict]:
+        if self.many_tool is None or self.fan_out <= 1:
+            return self.tool, {"question": question}
+        return self.many_tool, {"questions": [f"{question} (part {i + 1})" for i in range(self.fan_out)]}
+
+    def _read(self, messages, thread: FakeThread) -> tuple[str, int]:
+        # The question, and the context characters the model reads before the tool call
+        if isinstance(messages, str):
+            messages = [ChatMessage(role=Role.USER, text=messages)]
+        chars = self._thread_chars.get(thread.service_thread_id, 0) + sum(len(m.text) for m in messages)
+        self._thread_chars[thread.service_thread_id] = chars
+        return messages[-1].text, chars
+
+    def _latency(self, chars: int) -> float:
+        return self.model_latency / 2 + self.context_latency * chars / 4 / 1000
+
+    def _finish(self, thread: FakeThread, chars_before: int, tool_result: str, answer: str) -> list[UsageDetails]:
+        # Usage of each model step, as the service reports it: the tool call, then the answer
+        chars_after = chars_before + len(tool_result)
+        self._thread_chars[thread.service_thread_id] = chars_after + len(answer)
+        return [UsageDetails(input_token_count=chars_before // 4), UsageDetails(input_token_count=chars_after // 4)]
+
+    def _answer(self, tool_result: str) -> str:
+        # Like the real agent: a markdown table of the data, then a short analysis
+        answer = f"Here is what Genie found ({len(tool_result)} bytes of results).\n\n"
+        table = json.loads(tool_result).get("table")
+        if table:
+            answer += "| " + " | ".join(table["columns"]) + " |\n" + "|---" * len(table["columns"]) + "|\n"
+            for r in range(min(20, len(table["values"][0]) if table["values"] else 0)):
+                answer += "| " + " | ".join(column[r] for column in table["values"]) + " |\n"
+        return answer + "\n" + "Revenue grew steadily across regions. " * 4
+
+    def _chart_call(self, tool_result: str) -> Optional[dict]:
+        # Arguments for the local chart tool, when it is in use and the result has a dataset
+        dataset_id = json.loads(tool_result).get("dataset_id")
+        if not self.chart or self.chart_tool is None or dataset_id is None:
+            return None
+        return {"dataset_id": dataset_id, "kind": "line", "x": "month", "y": ["revenue"], "title": "Revenue by month"}
+
+    def _chart(self) -> DataContent:
+        return DataContent(uri="data:image/png;base64," + base64.b64encode(PNG_BYTES).decode(), media_type="image/png")
+
+    async def run(self, messages, thread: Optional[FakeThread] = None) -> AgentRunResponse:
+        thread = thread or FakeThread()
+        question, chars = self._read(messages, thread)
+        await asyncio.sleep(self._latency(chars))
+        tool, arguments = self._tool_call(question)
+        tool_result = await tool.invoke(**arguments)
+        chart_arguments = self._chart_call(tool_result)
+        if chart_arguments is not None:
+            await self.chart_tool.invoke(**chart_arguments)
+        await asyncio.sleep(self._latency(chars + len(tool_result)))
+
+        answer = self._answer(tool_result)
+        contents = [TextContent(text=answer)]
+        if self.chart and chart_arguments is None:
+            contents.append(self._chart())
+        return AgentRunResponse(
+            messages=[ChatMessage(role=Role.ASSISTANT, contents=contents)],
+            usage_details=sum(self._finish(thread, chars, tool_result, answer), UsageDetails()),
+        )
+
+    async def run_stream(self, messages, thread: Optional[FakeThread] = None):
+        thread = thread or FakeThread()
+        question, chars = self._read(messages, thread)
+        await asyncio.sleep(self._latency(chars))
+        tool, arguments = self._tool_call(question)
+        yield AgentRunResponseUpdate(
+            role=Role.ASSISTANT,
+            contents=[FunctionCallContent(call_id=uuid.uuid4().hex, name=tool.name, arguments=arguments)],
+        )
+        tool_result = await tool.invoke(**arguments)
+        chart_arguments = self._chart_call(tool_result)
+        if chart_arguments is not None:
+            yield AgentRunResponseUpdate(
+                role=Role.ASSISTANT,
+                contents=[FunctionCallContent(call_id=uuid.uuid4().hex, name=self.chart_tool.name, arguments=chart_arguments)],
+            )
+            await self.chart_tool.invoke(**chart_arguments)
+
+        answer = self._answer(tool_result)
+        size = -(-len(answer) // self.text_chunks)
+        for i in range(0, len(answer), size):
+            await asyncio.sleep(self._latency(chars + len(tool_result)) / self.text_chunks)
+            yield AgentRunResponseUpdate(role=Role.ASSISTANT, contents=[TextContent(text=answer[i:i + size])])
+        for usage in self._finish(thread, chars, tool_result, answer):
+            yield AgentRunResponseUpdate(role=Role.ASSISTANT, contents=[UsageContent(details=usage)])
+
+        if self.chart and chart_arguments is None:
+            yield AgentRunResponseUpdate(role=Role.ASSISTANT, contents=[self._chart()])
+
+
+def blob_stubs(base_url: str, latency: float = 0.05):
+    """
+    Replacements for utils.upload_blob_data and utils.get_blob_url that keep blobs in memory.
+    """
+    blobs: dict[str, bytes] = {}
+
+    async def upload_blob_data(name: str, data: bytes, account: str, container: str, content_type: str = "image/png") -> bool:
+        await asyncio.sleep(latency)
+        if name in blobs:
+            return False
+        blobs[name] = data
+        return True
+
+    async def get_blob_url(name: str, account: str, container: str) -> str:
+        return f"{base_url}/blobs/{name}"
+
+    return blobs, upload_blob_data, get_blob_url
@@ -0,0 +1,270 @@
+"""
+Load test: boots the aiohttp app from main.py against local fakes (see fakes.py) and drives concurrent
+synthetic Teams message activities at /api/messages.
+
+Reports p50/p95/p99 turn latency, throughput, event-loop lag of the app's loop and what reached the
+fake backends. No Azure, Foundry or Databricks access is needed.
+
+    python benchmarks/load_test.py --turns 200 --concurrency 20 --genie-latency 2 --model-latency 1
+    python benchmarks/load_test.py --turns 50 --no-streaming --rows 20000 --chart --json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timezone
+
+import aiohttp
+from aiohttp import web
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(BENCH_DIR), "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from fakes import BackendOptions, FakeAgent, FakeBackend, blob_stubs  # noqa: E402
+
+GENIE_SPACE_ID = "0" * 31 + "1"
+
+
+def configure_environment(backend_url: str, args: argparse.Namespace) -> None:
+    # Must run before the app modules are imported: they read their settings at import time
+    os.environ.update({
+        "CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTID": "00000000-0000-0000-0000-00000000000a",
+        "CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTSECRET": "load-test",
+        "CONNECTIONS__SERVICE_CONNECTION__SETTINGS__TENANTID": "00000000-0000-0000-0000-000000000001",
+        "AGENTAPPLICATION__USERAUTHORIZATION__HANDLERS__GRAPH__SETTINGS__AZUREBOTOAUTHCONNECTIONNAME": "GraphConnection",
+        "AGENTAPPLICATION__USERAUTHORIZATION__HANDLERS__GRAPH__SETTINGS__OBOCONNECTIONNAME": "",
+        "AZURE_AI_PROJECT_ENDPOINT": f"{backend_url}/foundry",
+        "AZURE_AI_MODEL_DEPLOYMENT_NAME": "load-test",
+        "ADB_CONNECTION_NAME": f"genie-{GENIE_SPACE_ID}",
+        "DATABRICKS_HOST": backend_url,
+        "AAD_AUTHORITY_HOST": backend_url,
+        "STORAGE_ACCTNAME": "loadtest",
+        "STORAGE_CONTNAME": "charts",
+        "CHART_RETENTION_HOURS": "0",
+        "STREAMING_RESPONSES": "true" if args.streaming else "false",
+        "GENIE_CACHE_TTL_SECONDS": "300" if args.cache else "0",
+        "TELEMETRY_EXPORTER": args.telemetry,
+        "LOCAL_CHARTS": "true" if args.local_chart else "false",
+        "LOG_LEVEL": "ERROR",
+    })
+    for name, value in args.env or []:
+        os.environ[name] = value
+
+
+def install_fakes(backend: FakeBackend, args: argparse.Namespace):
+    """
+    Import the app and point it at the fakes: the agent, blob storage and Bot Framework token service.
+    """
+    import app
+    import main
+    import utils
+    import agents.genie_agent as genie_agent
+    from microsoft_agents.hosting.core import AgentAuthConfiguration, ClaimsIdentity
+    from microsoft_agents.hosting.core.authorization import JwtTokenValidator
+    from microsoft_agents.hosting.core.rest_channel_service_client_factory import RestChannelServiceClientFactory
+
+    fake_agent = FakeAgent(
+        genie_agent.ask_genie_ai_function, model_latency=args.model_latency, chart=args.chart,
+        many_tool=genie_agent.ask_genie_many_ai_function, fan_out=args.fan_out,
+        chart_tool=genie_agent.render_chart_ai_function if args.local_chart else None,
+        context_latency=args.context_latency,
+    )
+
+    async def get_agent():
+        return fake_agent
+
+    genie_agent.get_agent = get_agent
+    _, utils.upload_blob_data, utils.get_blob_url = blob_stubs(backend.url, args.blob_latency)
+
+    # User tokens come from the fake token service; replies go to the activity's serviceUrl (the backend)
+    app.ADAPTER._channel_service_client_factory = RestChannelServiceClientFactory(
+        app.CONNECTION_MANAGER, token_service_endpoint=backend.url + "/"
+    )
+
+    # No client id: the JWT middleware accepts the unauthenticated test traffic. The user sign-in flow
+    # reads the bot's app id from the audience claim, which anonymous identities don't carry.
+    client_id = os.environ["CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTID"]
+    JwtTokenValidator.get_anonymous_claims = lambda self: ClaimsIdentity({"aud": client_id}, False, authentication_type="Anonymous")
+
+    return main.create_app(app.AGENT_APP, AgentAuthConfiguration())
+
+
+def activity(backend_url: str, channel: str, user: int, text: str) -> dict:
+    return {
+        "type": "message",
+        "id": uuid.uuid4().hex,
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "channelId": channel,
+        "serviceUrl": backend_url + "/",
+        "from": {"id": f"user-{user}", "aadObjectId": f"aad-user-{user}", "name": f"User {user}"},
+        "recipient": {"id": "bot", "name": "Data agent"},
+        "conversation": {"id": f"conversation-{user}"},
+        "text": text,
+        "locale": "en-US",
+    }
+
+
+async def monitor_loop_lag(samples: list[float], stop: asyncio.Event, interval: float = 0.01) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(time.perf_counter() - started - interval, 0.0))
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def drive(app_url: str, backend_url: str, args: argparse.Namespace) -> tuple[list[float], int, float]:
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: list[float] = []
+    errors = 0
+
+    # One conversation per user; a user never has two turns in flight so conversation state stays consistent
+    users = asyncio.Queue()
+    for user in range(max(args.users, args.concurrency)):
+        users.put_nowait(user)
+
+    async def turn(session: aiohttp.ClientSession, index: int) -> None:
+        nonlocal errors
+        async with semaphore:
+            user = await users.get()
+            question = f"What was total revenue by region for product line {index % args.distinct_questions}?"
+            started = time.perf_counter()
+            try:
+                async with session.post(f"{app_url}/api/messages", json=activity(backend_url, args.channel, user, question)) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            finally:
+                latencies.append(time.perf_counter() - started)
+                users.put_nowait(user)
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        started = time.perf_counter()
+        await asyncio.gather(*[turn(session, i) for i in range(args.turns)])
+        elapsed = time.perf_counter() - started
+    return latencies, errors, elapsed
+
+
+async def run(args: argparse.Namespace) -> dict:
+    backend = FakeBackend(BackendOptions(
+        obo_latency=args.obo_latency,
+        genie_latency=args.genie_latency,
+        result_rows=args.rows,
+        shared_oid="shared-reader" if args.shared_identity else None,
+    ))
+    backend_url = backend.start()
+    configure_environment(backend_url, args)
+    application = install_fakes(backend, args)
+
+    runner = web.AppRunner(application, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    app_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+
+    lag: list[float] = []
+    stop = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag, stop))
+
+    try:
+        if args.warmup:
+            warmup = argparse.Namespace(**{**vars(args), "turns": args.warmup})
+            await drive(app_url, backend_url, warmup)
+            lag.clear()
+        latencies, errors, elapsed = await drive(app_url, backend_url, args)
+    finally:
+        stop.set()
+        await monitor
+        await runner.cleanup()
+        backend.stop()
+
+    stats = backend.stats
+    return {
+        "turns": len(latencies),
+        "errors": errors,
+        "concurrency": args.concurrency,
+        "streaming": args.streaming,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_s": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies, default=0.0), 3),
+            "mean": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+        },
+        "loop_lag_ms": {
+            "p50": round(percentile(lag, 50) * 1000, 2),
+            "p99": round(percentile(lag, 99) * 1000, 2),
+            "max": round(max(lag, default=0.0) * 1000, 2),
+        },
+        "backend": {
+            "obo_exchanges": stats.obo_exchanges,
+            "user_tokens": stats.user_tokens,
+            "genie_questions": stats.genie_questions,
+            "genie_polls": stats.genie_polls,
+            "statement_fetches": stats.statement_fetches,
+            "replies": stats.replies,
+        },
+    }
+
+
+def print_report(report: dict) -> None:
+    latency, lag, backend = report["latency_s"], report["loop_lag_ms"], report["backend"]
+    print(f"turns: {report['turns']} ({report['errors']} errors), concurrency {report['concurrency']}, "
+          f"streaming {report['streaming']}")
+    print(f"throughput: {report['throughput_per_s']} turns/s over {report['elapsed_s']}s")
+    print(f"latency (s): p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}  mean {latency['mean']}")
+    print(f"event-loop lag (ms): p50 {lag['p50']}  p99 {lag['p99']}  max {lag['max']}")
+    print("backend: " + ", ".join(f"{key} {value}" for key, value in backend.items()))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--users", type=int, default=0, help="distinct users (at least --concurrency)")
+    parser.add_argument("--warmup", type=int, default=0, help="turns to run before measuring")
+    parser.add_argument("--distinct-questions", type=int, default=1000)
+    parser.add_argument("--genie-latency", type=float, default=2.0, help="seconds until a Genie message completes")
+    parser.add_argument("--model-latency", type=float, default=1.0, help="seconds the fake model spends per turn")
+    parser.add_argument("--context-latency", type=float, default=0.0,
+                        help="extra fake model seconds per 1,000 input tokens of thread context")
+    parser.add_argument("--obo-latency", type=float, default=0.05)
+    parser.add_argument("--blob-latency", type=float, default=0.05)
+    parser.add_argument("--rows", type=int, default=200, help="rows in each Genie result")
+    parser.add_argument("--chart", action="store_true", help="answers include a chart image")
+    parser.add_argument("--local-chart", action="store_true", help="with --chart, draw charts with the local renderer")
+    parser.add_argument("--shared-identity", action="store_true", help="all users query Databricks as one identity")
+    parser.add_argument("--fan-out", type=int, default=1, help="Genie sub-questions per turn (batched tool)")
+    parser.add_argument("--channel", default="msteams")
+    parser.add_argument("--streaming", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--cache", action="store_true", help="enable the Genie result cache")
+    parser.add_argument("--telemetry", default="none", help="TELEMETRY_EXPORTER for the app (none, memory, console, otlp)")
+    parser.add_argument("--env", nargs=2, action="append", metavar=("NAME", "VALUE"), help="extra app setting")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
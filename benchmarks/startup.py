@@ -0,0 +1,155 @@
+"""
+Startup benchmark: how long a fresh process takes to import the app, and how long a started server
+takes to answer /health (port bound) and /ready (background warm-up finished).
+
+Each run uses a new interpreter. Import time covers `import app, main`; the server runs against the
+local fakes from fakes.py, like the load test, so no Azure, Foundry or Databricks access is needed.
+
+    python benchmarks/startup.py --runs 5
+    python benchmarks/startup.py --runs 3 --json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCH_DIR), "src")
+
+
+def child_import() -> dict:
+    sys.path.insert(0, SRC_DIR)
+    started = time.perf_counter()
+    import app  # noqa: F401
+    import main  # noqa: F401
+    return {"import_s": time.perf_counter() - started}
+
+
+def child_serve(args: argparse.Namespace) -> dict:
+    import asyncio
+    import aiohttp
+    from aiohttp import web
+
+    sys.path.insert(0, BENCH_DIR)
+    from fakes import BackendOptions, FakeBackend
+    import load_test
+
+    async def serve() -> dict:
+        backend = FakeBackend(BackendOptions())
+        backend_url = backend.start()
+        load_test.configure_environment(backend_url, args)
+
+        # fakes.py has already imported Agent Framework, so this is not a clean import time
+        started = time.perf_counter()
+        application = load_test.install_fakes(backend, args)
+        runner = web.AppRunner(application, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+        result = {"listening_s": time.perf_counter() - started}
+
+        try:
+            async with aiohttp.ClientSession() as session:
+                for path, name in (("/health", "health_s"), ("/ready", "ready_s")):
+                    while True:
+                        async with session.get(url + path) as response:
+                            body = await response.read()
+                            if response.status == 200:
+                                break
+                        if time.perf_counter() - started > args.timeout:
+                            raise TimeoutError(f"{path} not ready after {args.timeout}s")
+                        await asyncio.sleep(0.01)
+                    result[name] = time.perf_counter() - started
+                result["warm_up"] = json.loads(body)["steps"]
+        finally:
+            await runner.cleanup()
+            backend.stop()
+        return result
+
+    return asyncio.run(serve())
+
+
+def run_child(mode: str, args: argparse.Namespace, env: dict) -> dict:
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode, "--timeout", str(args.timeout)]
+    completed = subprocess.run(command, env=env, capture_output=True, text=True, timeout=args.timeout + 30)
+    if completed.returncode != 0:
+        raise RuntimeError(f"{mode} run failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "median": round(statistics.median(values), 3),
+        "min": round(min(values), 3),
+        "max": round(max(values), 3),
+    }
+
+
+def run(args: argparse.Namespace) -> dict:
+    sys.path.insert(0, BENCH_DIR)
+    import load_test
+
+    # Settings the app needs to import; the serve runs point them at their own fake backend
+    load_test.configure_environment("http://127.0.0.1:9", args)
+    env = dict(os.environ)
+
+    imports = [run_child("import", args, env) for _ in range(args.runs)]
+    serves = [run_child("serve", args, env) for _ in range(args.runs)]
+
+    return {
+        "runs": args.runs,
+        "import_s": summarize([r["import_s"] for r in imports]),
+        "listening_s": summarize([r["listening_s"] for r in serves]),
+        "health_s": summarize([r["health_s"] for r in serves]),
+        "ready_s": summarize([r["ready_s"] for r in serves]),
+        "warm_up": serves[-1]["warm_up"],
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"runs: {report['runs']}")
+    for key, label in (("import_s", "import app, main"), ("listening_s", "app built + listening"),
+                       ("health_s", "/health OK"), ("ready_s", "/ready OK")):
+        stats = report[key]
+        print(f"{label} (s): median {stats['median']}  min {stats['min']}  max {stats['max']}")
+    print("warm-up: " + ", ".join(f"{step} {status}" for step, status in report["warm_up"].items()))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--child", choices=["import", "serve"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Settings load_test.configure_environment reads. No chart storage: blob warm-up would need real Azure credentials.
+    args.streaming = True
+    args.cache = False
+    args.telemetry = "none"
+    args.env = [("STORAGE_ACCTNAME", "")]
+    args.chart = False
+    args.local_chart = False
+    args.context_latency = 0.0
+    args.model_latency = 0.0
+    args.blob_latency = 0.0
+    args.fan_out = 1
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child == "import":
+        print(json.dumps(child_import()))
+    elif args.child == "serve":
+        print(json.dumps(child_serve(args)))
+    else:
+        report = run(args)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print_report(report)
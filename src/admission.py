@@ -0,0 +1,149 @@
+import os
+import time
+import asyncio
+import logging
+import telemetry
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+logger = logging.getLogger("microsoft_agents")
+
+# Admission control for agent turns. Each turn can hold a Foundry run, a Genie warehouse query and a
+# code interpreter session, so only a bounded number run at once; the rest wait in a bounded queue
+# and anything beyond that is turned away immediately.
+MAX_CONCURRENT_TURNS = int(os.getenv("MAX_CONCURRENT_TURNS", "16"))
+MAX_CONCURRENT_TURNS_PER_USER = int(os.getenv("MAX_CONCURRENT_TURNS_PER_USER", "2"))
+MAX_QUEUED_TURNS = int(os.getenv("MAX_QUEUED_TURNS", "32"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "30"))
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a turn cannot be admitted because the wait queue is full or the wait timed out.
+    """
+
+
+class AdmissionController:
+    """
+    Limits in-flight turns globally and per user. Turns over either limit wait in a bounded queue
+    until a slot frees up or the queue timeout passes.
+    """
+
+    def __init__(self, max_concurrent: int, max_per_user: int, max_queued: int, queue_timeout: float):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+
+        self._condition = asyncio.Condition()
+        self._active = 0
+        self._active_by_user: dict[str, int] = {}
+        self._waiting = 0
+
+        # Counters reported by metrics()
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._max_waiting = 0
+        self._total_wait_seconds = 0.0
+
+    def _has_slot(self, user_id: str) -> bool:
+        if self.max_concurrent > 0 and self._active >= self.max_concurrent:
+            return False
+        if self.max_per_user > 0 and self._active_by_user.get(user_id, 0) >= self.max_per_user:
+            return False
+        return True
+
+    def _take_slot(self, user_id: str) -> None:
+        self._active += 1
+        self._active_by_user[user_id] = self._active_by_user.get(user_id, 0) + 1
+        self._admitted += 1
+
+    async def _acquire(self, user_id: str, on_queued: Optional[Callable[[], Awaitable[None]]]) -> None:
+        async with self._condition:
+            if self._has_slot(user_id):
+                self._take_slot(user_id)
+                return
+
+            if self._waiting >= self.max_queued:
+                self._rejected += 1
+                logger.warning(f"Turn rejected: {self._active} active, {self._waiting} queued")
+                raise AdmissionRejected("The wait queue is full")
+
+            self._waiting += 1
+            self._max_waiting = max(self._max_waiting, self._waiting)
+
+        started = time.monotonic()
+        try:
+            with telemetry.phase("admission.wait"):
+                # Outside the lock so a slow notification doesn't hold up other turns
+                if on_queued is not None:
+                    await on_queued()
+
+                async with self._condition:
+                    remaining = self.queue_timeout - (time.monotonic() - started)
+                    await asyncio.wait_for(self._condition.wait_for(lambda: self._has_slot(user_id)), max(remaining, 0))
+                    self._take_slot(user_id)
+        except asyncio.TimeoutError:
+            self._timed_out += 1
+            logger.warning(f"Turn timed out after {self.queue_timeout}s in the admission queue")
+            raise AdmissionRejected("Timed out waiting for a free slot")
+        finally:
+            self._waiting -= 1
+            self._total_wait_seconds += time.monotonic() - started
+
+    async def _release(self, user_id: str) -> None:
+        async with self._condition:
+            self._active -= 1
+            remaining = self._active_by_user.get(user_id, 1) - 1
+            if remaining > 0:
+                self._active_by_user[user_id] = remaining
+            else:
+                self._active_by_user.pop(user_id, None)
+            # Waiters are blocked on different limits, so wake all of them to re-check
+            self._condition.notify_all()
+
+    @asynccontextmanager
+    async def admit(self, user_id: str, on_queued: Optional[Callable[[], Awaitable[None]]] = None) -> AsyncIterator[None]:
+        """
+        Hold a turn slot for the duration of the block. on_queued is awaited when the turn has to
+        wait for a slot. Raises AdmissionRejected when the turn cannot be admitted.
+        """
+        await self._acquire(user_id, on_queued)
+        try:
+            yield
+        finally:
+            await self._release(user_id)
+
+    def metrics(self) -> dict:
+        """
+        Current load and counters since startup.
+        """
+        return {
+            "active": self._active,
+            "queued": self._waiting,
+            "active_users": len(self._active_by_user),
+            "max_concurrent": self.max_concurrent,
+            "max_per_user": self.max_per_user,
+            "max_queued": self.max_queued,
+            "admitted": self._admitted,
+            "rejected": self._rejected,
+            "timed_out": self._timed_out,
+            "max_queue_depth": self._max_waiting,
+            "total_wait_seconds": round(self._total_wait_seconds, 3),
+        }
+
+
+admission = AdmissionController(
+    MAX_CONCURRENT_TURNS,
+    MAX_CONCURRENT_TURNS_PER_USER,
+    MAX_QUEUED_TURNS,
+    ADMISSION_QUEUE_TIMEOUT_SECONDS,
+)
+
+
+__all__ = [
+    "AdmissionController",
+    "AdmissionRejected",
+    "admission",
+]
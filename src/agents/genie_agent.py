@@ -1,46 +1,146 @@
 import os
-from typing import Optional
+import time
+import base64
+import asyncio
+from contextlib import nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict, field
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional, Union
 
 # Use Agent Framework SDK for core functionality, agents, and telemetry
 from agent_framework import (
     AgentRunResponse,
+    AgentRunResponseUpdate,
     ChatAgent, 
+    ChatMessage,
+    Contents,
     get_logger,
     ai_function,
     HostedCodeInterpreterTool,
     TextContent,
     DataContent,
+    HostedFileContent,
+    FunctionCallContent,
 )
-from agent_framework.azure import (
-    AzureAIAgentClient,
-    AzureOpenAIChatClient,
-)
+
+# The Azure AI client stack (azure.ai.projects and friends) is imported when the agent is created
+if TYPE_CHECKING:
+    from agent_framework.azure import AzureAIAgentClient
 
 import logging
-from dotenv import load_dotenv
 import agents.genie_tools as tools
+import agents.genie_router as router
+import agents.genie_charts as charts
+import agents.genie_context as context
+from agents.genie_datasets import dataset_store
+import resilience
+import telemetry
 import utils
 
-load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
-
 # Module-level state
-azure_ai_client: Optional[AzureAIAgentClient] = None
-chat_client: Optional[AzureOpenAIChatClient] = None
+azure_ai_client: Optional["AzureAIAgentClient"] = None
+genie_chat_agent: Optional[ChatAgent] = None
 invalid_foundry_connection: bool = False
+# Service principal credential for Foundry; created on first use
+async_credential = None
+
+# Guards creation/teardown of the shared client and agent
+_agent_lock = asyncio.Lock()
+
+AGENT_NAME = "data-analysis-assistant"
+
+# Foundry project and model deployment the shared agent is created in
+AZURE_AI_PROJECT_ENDPOINT = os.getenv("AZURE_AI_PROJECT_ENDPOINT", "")
+AZURE_AI_MODEL_DEPLOYMENT_NAME = os.getenv("AZURE_AI_MODEL_DEPLOYMENT_NAME", "")
+
+# Databricks token of the user whose turn is being processed. Set per turn by process_message so
+# concurrent conversations never see each other's credentials.
+current_adb_token: ContextVar[Optional[str]] = ContextVar("current_adb_token", default=None)
+
+# Sessions idle for longer than this start over with a fresh Genie conversation and Foundry thread
+CONVERSATION_TTL_SECONDS = int(os.getenv("CONVERSATION_TTL_SECONDS", "3600"))
+
+
+@dataclass
+class ConversationSession:
+    """
+    Genie conversation and Foundry thread of one user in one Teams conversation. Stored in
+    conversation state between turns so follow-up questions keep their context. The recent turns
+    and summary seed a fresh thread when the current one has grown too large (see genie_context).
+    """
+    genie_conversation_id: Optional[str] = None
+    thread_id: Optional[str] = None
+    updated_at: float = 0.0
+    # Context size of the last run (see genie_context.input_tokens) and runs so far on the current thread
+    context_tokens: int = 0
+    thread_turns: int = 0
+    # Last few exchanges ({"question", "answer"}) and a summary of the ones before
+    recent_turns: list[dict] = field(default_factory=list)
+    summary: str = ""
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "ConversationSession":
+        if not data:
+            return cls()
+        session = cls(
+            genie_conversation_id=data.get("genie_conversation_id"),
+            thread_id=data.get("thread_id"),
+            updated_at=data.get("updated_at") or 0.0,
+            context_tokens=data.get("context_tokens") or 0,
+            thread_turns=data.get("thread_turns") or 0,
+            recent_turns=list(data.get("recent_turns") or []),
+            summary=data.get("summary") or "",
+        )
+        if time.time() - session.updated_at > CONVERSATION_TTL_SECONDS:
+            return cls()
+        return session
+
+
+# Session of the turn being processed; ask_genie_ai_function reads and updates it
+current_session: ContextVar[Optional[ConversationSession]] = ContextVar("current_session", default=None)
+
+# Progress callback for streaming turns: called with ("status", text) for tool activity and
+# ("text", chunk) for response text as the model produces it
+ProgressCallback = Callable[[str, str], Awaitable[None]]
+
+# Progress callback and cancellation event of the turn being processed; ask_genie_ai_function
+# forwards Genie status changes to the callback and abandons its wait once the event is set
+current_progress: ContextVar[Optional[ProgressCallback]] = ContextVar("current_progress", default=None)
+current_cancelled: ContextVar[Optional[asyncio.Event]] = ContextVar("current_cancelled", default=None)
+
+# Genie questions a single turn may have in flight, across parallel tool calls and ask_genie_many_ai_function
+GENIE_TURN_CONCURRENCY = int(os.getenv("GENIE_TURN_CONCURRENCY", "4"))
+current_genie_slots: ContextVar[Optional[asyncio.Semaphore]] = ContextVar("current_genie_slots", default=None)
+# Held while a question of the turn is in the session's Genie conversation, which answers one message at a time
+current_genie_conversation: ContextVar[Optional[asyncio.Lock]] = ContextVar("current_genie_conversation", default=None)
+
+# Blob names of the charts render_chart_ai_function drew during the turn being processed
+current_charts: ContextVar[Optional[list[str]]] = ContextVar("current_charts", default=None)
+
+# Attempts at a Foundry run; a run is only retried when nothing has been streamed to the user yet
+FOUNDRY_MAX_ATTEMPTS = int(os.getenv("FOUNDRY_MAX_ATTEMPTS", "2"))
+
+# Status shown to the user while a tool is running
+TOOL_STATUS = {
+    "ask_genie_ai_function": "Querying Genie...",
+    "ask_genie_many_ai_function": "Querying Genie with several questions at once...",
+    "render_chart_ai_function": "Drawing chart...",
+}
+CODE_INTERPRETER_STATUS = "Running analysis..."
 
 logger = logging.getLogger("microsoft_agents")
 
 ADB_CONNECTION_NAME = os.getenv("ADB_CONNECTION_NAME", "")
 genie_workspaceid: str = ADB_CONNECTION_NAME[-32:]
 
-# Create images directory if it doesn't exist
-IMAGES_DIR = os.path.join(os.getcwd(), "images")
-if not os.path.exists(IMAGES_DIR):
-    os.makedirs(IMAGES_DIR)
+# Blob storage for chart images shown in Teams cards
+STORAGE_ACCTNAME = os.getenv("STORAGE_ACCTNAME", "")
+STORAGE_CONTNAME = os.getenv("STORAGE_CONTNAME", "")
 
-# Load agent instructions from markdown file
-with open(os.path.join(os.path.dirname(__file__), "genie_agent_prompt.md"), "r") as f:
-    agent_instructions = f.read()
+AGENT_INSTRUCTIONS_FILE = os.path.join(os.path.dirname(__file__), "genie_agent_prompt.md")
 
 # Create AI function for ask_genie using Agent Framework SDK
 @ai_function
@@ -55,81 +155,501 @@ async def ask_genie_ai_function(question: str, conversation_id: str = None) -> s
     Returns:
         JSON string with the response from Genie
     """
-    return await tools.ask_genie(question, conversation_id, genie_workspaceid, utils.adbtoken)
+    return tools.result_to_json(await _ask_genie(question, conversation_id))
 
-# Initialize Agent Framework SDK clients
-try:
-    # Set up Azure credentials for Agent Framework SDK
-    from azure.identity.aio import ClientSecretCredential as AsyncClientSecretCredential
-    
-    async_credential = AsyncClientSecretCredential(
-        tenant_id=os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__TENANTID"),
-        client_id=os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTID"),
-        client_secret=os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTSECRET"),
-    )
-    
-except Exception as e:
-    logger.error(f"Failed to initialize Azure AI clients: {e}")
-    invalid_foundry_connection = True
-    genie_workspaceid = None
-    azure_ai_client = None
-    azure_chat_client = None
-
-
-# Wrap the agent function-calling flow: create agent, run, execute any required tools
-async def process_message(question: str, conversation_id: str = None) -> tuple[str, Optional[str]]:
-
-    async with AzureAIAgentClient(async_credential=async_credential) as azure_chat_client:
-        agent: ChatAgent = azure_chat_client.create_agent(
-            name="data-analysis-assistant",
-            instructions=agent_instructions,
-            tools=[ask_genie_ai_function, HostedCodeInterpreterTool()]
+
+async def _ask_genie(question: str, conversation_id: Optional[str] = None) -> dict:
+    conversation = current_genie_conversation.get()
+    if conversation is not None and conversation.locked():
+        # A parallel call of this turn is using the session's Genie conversation: ask this question
+        # in a new conversation, like ask_genie_many_ai_function, and leave the session alone
+        return await _ask_genie_in(question, None)
+
+    async with conversation if conversation is not None else nullcontext():
+        # Prefer the Genie conversation tracked in the user's session over whatever the model passes
+        session = current_session.get()
+        if session is not None and session.genie_conversation_id:
+            conversation_id = session.genie_conversation_id
+
+        result = await _ask_genie_in(question, conversation_id)
+
+        if session is not None:
+            # A failed follow-up may mean the Genie conversation is gone; start a new one next time
+            session.genie_conversation_id = None if "error" in result else result.get("conversation_id")
+
+    return result
+
+
+async def _ask_genie_in(question: str, conversation_id: Optional[str]) -> dict:
+    slots = current_genie_slots.get()
+    async with slots if slots is not None else nullcontext():
+        return await tools.ask_genie_result(
+            question, conversation_id, genie_workspaceid, current_adb_token.get(),
+            on_status=_genie_status_callback(), cancelled=current_cancelled.get(),
         )
 
+
+@ai_function
+async def ask_genie_many_ai_function(questions: list[str]) -> str:
+    """
+    Ask Genie several independent questions at once, for example the same metric for different
+    regions or time periods. The questions run in parallel, each in a new Genie conversation.
+
+    Args:
+        questions: The questions to ask Genie, each one answerable on its own
+
+    Returns:
+        JSON string with a "results" list holding one Genie response per question, in the same order
+    """
+    results = await tools.ask_genie_many_result(
+        questions, genie_workspaceid, current_adb_token.get(),
+        on_status=_genie_status_callback(), cancelled=current_cancelled.get(), limit=current_genie_slots.get(),
+    )
+    return tools.result_to_json({
+        "results": [{"question": question, **result} for question, result in zip(questions, results)]
+    })
+
+
+@ai_function
+async def render_chart_ai_function(dataset_id: str, kind: str, x: str, y: list[str], title: str = "") -> str:
+    """
+    Draw a bar, line or pie chart of a Genie result and show it to the user below the answer.
+
+    Args:
+        dataset_id: The dataset_id of the ask_genie_ai_function result to draw
+        kind: Chart kind: "bar", "line" or "pie"
+        x: Column holding the categories (bar, pie) or the x axis values (line), in row order
+        y: Numeric columns to draw, one series each; a pie chart takes exactly one
+        title: Chart title, in the user's language
+
+    Returns:
+        JSON string confirming the chart, or an error to act on
+    """
+    adbtoken = current_adb_token.get()
+    dataset = dataset_store.get(dataset_id, utils.token_identity(adbtoken)) if adbtoken else None
+    if dataset is None:
+        return tools.result_to_json({"error": "Unknown or expired dataset_id. Ask Genie again for the data."})
+
+    try:
+        with telemetry.phase("chart.render", kind=kind, rows=len(dataset.rows)):
+            data = await charts.render_chart(dataset, kind, x, y, title)
+        file_name = await _upload_chart(data)
+    except charts.ChartError as e:
+        return tools.result_to_json({"error": str(e)})
+    except Exception as e:
+        logger.error(f"Local chart rendering failed: {e!r}")
+        return tools.result_to_json({"error": "The chart could not be drawn. Use the code interpreter instead."})
+
+    drawn = current_charts.get()
+    if drawn is not None:
+        drawn.append(file_name)
+    return tools.result_to_json({"chart": "The chart is shown to the user below the answer."})
+
+
+def _genie_status_callback() -> Optional[tools.StatusCallback]:
+    # Forward Genie progress to the turn's progress callback as status updates (streaming turns only)
+    on_progress = current_progress.get()
+    if on_progress is None:
+        return None
+
+    async def on_status(text: str) -> None:
+        await on_progress("status", text)
+
+    return on_status
+
+def _get_credential():
+    """
+    Return the Azure credential for Agent Framework SDK, creating it on first use.
+    """
+    global async_credential, invalid_foundry_connection, genie_workspaceid
+
+    if async_credential is None:
         try:
-            # Execute the agent with the user message using ChatAgent.run()
-            result: AgentRunResponse = await agent.run(question)
-
-            file_name = None
-            response = ""
-            
-            # Extract response from the result
-            if result:
-                response = result.text or ""
-                
-                # Check if there are any data/file outputs (e.g., from code interpreter)
-                if hasattr(result, 'messages') and result.messages:
-                    # Iterate through ChatMessage objects in the response
-                    for message in result.messages:
-                        # Check if the ChatMessage has contents
-                        if hasattr(message, 'contents') and message.contents:
-                            for content_item in message.contents:
-                                if isinstance(content_item, TextContent):
-                                    # Update response text if we find text content
-                                    if content_item.text:
-                                        response = content_item.text
-                                elif isinstance(content_item, DataContent):
-                                    # Handle data/file content (e.g., images from code interpreter)
-                                    if content_item.type == "image/png" and hasattr(content_item, 'data'):
-                                        # Save the image file
-                                        file_name = f"agent_output_{getattr(content_item, 'id', 'unknown')}.png"
-                                        file_path = os.path.join(IMAGES_DIR, file_name)
-                                        
-                                        with open(file_path, "wb") as f:
-                                            f.write(content_item.data)
-                                        
-                                        # Upload visualization to blob storage for Teams card rendering
-                                        await utils.upload_blob_file(file_name)
-        
+            from azure.identity.aio import ClientSecretCredential as AsyncClientSecretCredential
+
+            async_credential = AsyncClientSecretCredential(
+                tenant_id=os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__TENANTID"),
+                client_id=os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTID"),
+                client_secret=os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTSECRET"),
+            )
         except Exception as e:
-            logger.error(f"Error executing agent: {e}")
-            response = f"Sorry, I encountered an error processing your request: {str(e)}"
-            file_name = None
+            logger.error(f"Failed to initialize Azure AI clients: {e}")
+            invalid_foundry_connection = True
+            genie_workspaceid = None
+            raise
+
+    return async_credential
+
+
+# Bind the user's Databricks token and conversation session to this turn, then run the agent with them.
+# The session is updated in place with the Genie conversation and Foundry thread used by the turn.
+# When on_progress is given the agent runs in streaming mode and reports tool status and text as it goes.
+# Setting `cancelled` stops any Genie wait of the turn early (the user has moved on to a newer message).
+# With GENIE_FAST_PATH enabled, plain data questions are answered from Genie directly (see genie_router).
+async def process_message(
+    question: str,
+    adbtoken: str,
+    session: Optional[ConversationSession] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    cancelled: Optional[asyncio.Event] = None,
+) -> tuple[str, list[str]]:
+    if session is None:
+        session = ConversationSession()
+
+    adbtoken_reset = current_adb_token.set(adbtoken)
+    session_reset = current_session.set(session)
+    progress_reset = current_progress.set(on_progress)
+    cancelled_reset = current_cancelled.set(cancelled)
+    slots_reset = current_genie_slots.set(asyncio.Semaphore(GENIE_TURN_CONCURRENCY))
+    conversation_reset = current_genie_conversation.set(asyncio.Lock())
+    charts_reset = current_charts.set([])
+    try:
+        if router.GENIE_FAST_PATH and router.is_fast_path_question(question):
+            response = await _answer_from_genie(question, session, on_progress)
+            if response is not None:
+                return response, []
+        return await _run_agent(question, session, on_progress)
+    finally:
+        current_charts.reset(charts_reset)
+        current_genie_conversation.reset(conversation_reset)
+        current_genie_slots.reset(slots_reset)
+        current_cancelled.reset(cancelled_reset)
+        current_progress.reset(progress_reset)
+        current_session.reset(session_reset)
+        current_adb_token.reset(adbtoken_reset)
+
+
+async def _answer_from_genie(
+    question: str, session: ConversationSession, on_progress: Optional[ProgressCallback] = None
+) -> Optional[str]:
+    """
+    Fast path: ask Genie directly and render its answer without an agent run. Returns None when
+    the result needs the agent (errors, empty tables), which then handles the question from scratch.
+    The exchange is not added to the Foundry thread; the Genie conversation still carries it.
+    """
+    with telemetry.phase("fast_path") as span:
+        if on_progress is not None:
+            await on_progress("status", TOOL_STATUS["ask_genie_ai_function"])
+        response = router.render_result(await _ask_genie(question))
+        span.set_attribute("fast_path.answered", response is not None)
+
+    if response is not None:
+        session.updated_at = time.time()
+        context.record_turn(session, question, response)
+    return response
+
+
+def _agent_client_class() -> type:
+    from agent_framework.azure import AzureAIAgentClient
+    return AzureAIAgentClient
+
+
+async def get_agent() -> ChatAgent:
+    """
+    Return the shared agent, creating the Foundry client and server-side agent on first use.
+    The agent is created here under the lock, not lazily by the client's first run, where
+    concurrent first turns would each provision one; every later turn reuses it.
+    """
+    global azure_ai_client, genie_chat_agent
+
+    if genie_chat_agent is not None:
+        return genie_chat_agent
+
+    async with _agent_lock:
+        if genie_chat_agent is None:
+            with telemetry.phase("agent.create"):
+                AzureAIAgentClient = _agent_client_class()
+                with open(AGENT_INSTRUCTIONS_FILE, "r") as f:
+                    agent_instructions = f.read()
+                agent_tools = [ask_genie_ai_function, ask_genie_many_ai_function, HostedCodeInterpreterTool()]
+                if charts.LOCAL_CHARTS:
+                    agent_instructions += charts.LOCAL_CHART_INSTRUCTIONS
+                    agent_tools.append(render_chart_ai_function)
+                from azure.ai.projects.aio import AIProjectClient
+
+                project_client = AIProjectClient(endpoint=AZURE_AI_PROJECT_ENDPOINT, credential=_get_credential())
+                created = client = None
+                try:
+                    # Runs pass the tools and instructions themselves; the definition only needs the model
+                    created = await project_client.agents.create_agent(
+                        model=AZURE_AI_MODEL_DEPLOYMENT_NAME, name=AGENT_NAME, instructions=agent_instructions
+                    )
+                    client = AzureAIAgentClient(
+                        project_client=project_client,
+                        agent_id=created.id,
+                        agent_name=AGENT_NAME,
+                        model_deployment_name=AZURE_AI_MODEL_DEPLOYMENT_NAME,
+                        async_credential=_get_credential(),
+                    )
+                    chat_agent = client.create_agent(
+                        name=AGENT_NAME,
+                        instructions=agent_instructions,
+                        tools=agent_tools,
+                    )
+                except BaseException:
+                    # Including cancellation (warm-up timeout): nothing would reuse or close what was built
+                    await _release_agent(project_client, created.id if created is not None else None, client)
+                    raise
+            azure_ai_client, genie_chat_agent = client, chat_agent
+            logger.info(f"Created shared Azure AI agent {created.id}")
+
+    return genie_chat_agent
+
+
+async def warm_up() -> None:
+    """
+    Create the shared client and server-side agent ahead of the first turn, which also opens the
+    connection to the Foundry project and acquires the service principal's token.
+    """
+    # Import the client stack on a worker thread so the event loop keeps serving meanwhile
+    await asyncio.to_thread(_agent_client_class)
+    await get_agent()
+
+
+async def close_agent() -> None:
+    """
+    Delete the server-side agent created by get_agent and close the shared client, so the next
+    call to get_agent reconnects from scratch.
+    """
+    global azure_ai_client, genie_chat_agent
+
+    async with _agent_lock:
+        client, azure_ai_client, genie_chat_agent = azure_ai_client, None, None
+
+    if client is not None:
+        await _release_agent(client.project_client, client.agent_id, client)
+
+
+async def _release_agent(project_client, agent_id: Optional[str], client=None) -> None:
+    """
+    Delete a server-side agent created by get_agent and close its clients, logging any failure.
+    """
+    if agent_id is not None:
+        try:
+            await project_client.agents.delete_agent(agent_id)
+        except Exception as e:
+            logger.warning(f"Error deleting Azure AI agent {agent_id}: {e}")
+    try:
+        if client is not None:
+            await client.close()
+        # The project client was passed in, so the agent client leaves it open
+        await project_client.close()
+    except Exception as e:
+        logger.warning(f"Error closing Azure AI agent client: {e}")
+
+
+async def _agent_is_healthy() -> bool:
+    """
+    Check that the shared client can still reach its server-side agent.
+    """
+    client = azure_ai_client
+    if client is None:
+        return False
+    try:
+        await client.project_client.agents.get_agent(client.agent_id)
+        return True
+    except Exception as e:
+        logger.warning(f"Azure AI agent health check failed: {e}")
+        return False
+
+
+def _is_code_interpreter_update(update: AgentRunResponseUpdate) -> bool:
+    # Code interpreter run steps surface as updates whose innermost raw representation is a
+    # RunStepDeltaCodeInterpreter* object; their text is sandbox log output, not the answer
+    raw = getattr(update, "raw_representation", None)
+    raw = getattr(raw, "raw_representation", raw)
+    return type(raw).__name__.startswith("RunStepDeltaCodeInterpreter")
+
+
+async def _run_agent_stream(
+    agent: ChatAgent, messages: Union[str, list[ChatMessage]], thread, on_progress: Optional[ProgressCallback] = None
+) -> tuple[AgentRunResponse, str, Optional[int]]:
+    """
+    Run the agent with run_stream and return the combined response, the answer text and the input
+    tokens of the run's largest model step. Both modes answer with this text; with on_progress, tool
+    status and the answer go out as they arrive.
+
+    Text the model writes before any tool has run is usually a preamble to a tool call: it is held
+    back and dropped once a tool is called, or sent at the end of a run that calls none. Text after
+    a tool has run is part of the answer, with a blank line where it resumes after further tool
+    calls. Code interpreter output is never part of it.
+    """
+    updates: list[AgentRunResponseUpdate] = []
+    last_status = None
+    answer = ""
+    held = ""
+    tool_used = False
+    new_paragraph = False
+
+    async def tool_activity(status: Optional[str]) -> None:
+        nonlocal last_status, held, tool_used, new_paragraph
+        held = ""
+        tool_used = True
+        new_paragraph = True
+        if status is not None and status != last_status:
+            last_status = status
+            if on_progress is not None:
+                await on_progress("status", status)
+
+    async def add_text(text: str) -> None:
+        nonlocal answer, new_paragraph
+        if new_paragraph and answer:
+            text = "\n\n" + text
+        new_paragraph = False
+        answer += text
+        if on_progress is not None:
+            await on_progress("text", text)
+
+    async for update in agent.run_stream(messages, thread=thread):
+        updates.append(update)
+
+        if _is_code_interpreter_update(update):
+            await tool_activity(CODE_INTERPRETER_STATUS)
+            continue
+
+        for content in update.contents or []:
+            if isinstance(content, FunctionCallContent):
+                await tool_activity(TOOL_STATUS.get(content.name))
+            elif isinstance(content, TextContent) and content.text:
+                if tool_used:
+                    await add_text(content.text)
+                else:
+                    held += content.text
+
+    if held:
+        await add_text(held)
+    return AgentRunResponse.from_agent_run_response_updates(updates), answer, context.input_tokens(updates)
+
+
+# Wrap the agent function-calling flow: run the shared agent, execute any required tools
+async def _run_agent(question: str, session: ConversationSession, on_progress: Optional[ProgressCallback] = None) -> tuple[str, list[str]]:
+    agent = await get_agent()
+
+    # A thread that has grown past the context budget is left behind for a fresh one
+    if context.needs_rollover(session):
+        logger.info(f"Starting a fresh Foundry thread after {session.thread_turns} turns ({session.context_tokens} input tokens)")
+        session.thread_id = None
+
+    # Continue the Foundry thread of this conversation when there is one; a fresh thread starts from
+    # the recent exchanges and the summary of older ones
+    messages = question
+    if session.thread_id:
+        thread = agent.get_new_thread(service_thread_id=session.thread_id)
+    else:
+        thread = agent.get_new_thread()
+        session.thread_turns = 0
+        session.context_tokens = 0
+        if session.recent_turns or session.summary:
+            messages = context.seed_messages(session, question)
+
+    # Set once anything reaches the user; a run that failed after that point is not retried
+    reported = False
+
+    async def report(kind: str, text: str) -> None:
+        nonlocal reported
+        reported = True
+        await on_progress(kind, text)
+
+    def retryable(error: BaseException) -> bool:
+        return not reported and resilience.is_transient(error)
+
+    try:
+        # Execute the agent with the user message using ChatAgent.run_stream(). Both modes take the
+        # answer from the stream, so they give the same answer; only streaming turns report progress.
+        with telemetry.phase("agent.run", streaming=on_progress is not None):
+            result, response, context_tokens = await resilience.call_with_retry(
+                _run_agent_stream, agent, messages, thread, report if on_progress is not None else None,
+                dependency="foundry", max_attempts=FOUNDRY_MAX_ATTEMPTS, retryable=retryable,
+            )
+        session.thread_id = thread.service_thread_id
+        session.updated_at = time.time()
+        session.thread_turns += 1
+        session.context_tokens = context_tokens or 0
+
+        # Chart images produced by the run: DataContent carries the PNG inline, HostedFileContent
+        # refers to a code interpreter output file in the Foundry project
+        images: list[Contents] = []
+
+        if result:
+            # Check if there are any data/file outputs (e.g., from code interpreter)
+            if hasattr(result, 'messages') and result.messages:
+                # Iterate through ChatMessage objects in the response
+                for message in result.messages:
+                    # Check if the ChatMessage has contents
+                    if hasattr(message, 'contents') and message.contents:
+                        for content_item in message.contents:
+                            if isinstance(content_item, DataContent):
+                                # Handle data/file content (e.g., images from code interpreter)
+                                if content_item.media_type == "image/png":
+                                    images.append(content_item)
+                            elif isinstance(content_item, HostedFileContent):
+                                images.append(content_item)
+
+        # Upload visualizations to blob storage for Teams card rendering, straight from memory and in parallel.
+        # Blobs are named by content hash, so identical charts are only stored once. A chart that
+        # fails to upload is left out rather than failing the answer.
+        uploaded = []
+        for outcome in await asyncio.gather(*[_upload_image(content) for content in images], return_exceptions=True):
+            if isinstance(outcome, BaseException):
+                logger.error(f"Chart image upload failed: {outcome!r}")
+            else:
+                uploaded.append(outcome)
+        file_names = list(dict.fromkeys((current_charts.get() or []) + uploaded))
+
+        context.record_turn(session, question, response)
+
+    except resilience.DeadlineExceeded as e:
+        logger.warning(f"Agent run exceeded the turn deadline: {e}")
+        response = "Sorry, this is taking longer than expected. Please try again, or narrow down the question."
+        file_names = []
+        session.thread_id = None
+        return response, file_names
+
+    except Exception as e:
+        logger.error(f"Error executing agent: {e}")
+        response = f"Sorry, I encountered an error processing your request: {str(e)}"
+        file_names = []
+
+        # Start the next turn on a fresh thread in case the stored one is what failed
+        session.thread_id = None
+
+        # Drop a broken client so the next turn reconnects instead of failing the same way
+        if not await _agent_is_healthy():
+            await close_agent()
+
+    return response, file_names
+
+
+async def _image_bytes(content: Contents) -> bytes:
+    if isinstance(content, HostedFileContent):
+        stream = await azure_ai_client.project_client.agents.files.get_content(content.file_id)
+        return b"".join([chunk async for chunk in stream])
+    # data:image/png;base64,<data>
+    return base64.b64decode(content.uri.split(",", 1)[1])
+
+
+async def _upload_image(content: Contents) -> str:
+    with telemetry.phase("chart.download"):
+        data = await _image_bytes(content)
+    return await _upload_chart(data)
+
+
+async def _upload_chart(data: bytes) -> str:
+    file_name = utils.content_blob_name(data)
+    with telemetry.phase("chart.upload", bytes=len(data)) as span:
+        uploaded = await utils.upload_blob_data(file_name, data, STORAGE_ACCTNAME, STORAGE_CONTNAME)
+        span.set_attribute("chart.reused", not uploaded)
+    if not uploaded:
+        logger.info(f"Reusing existing chart image {file_name}")
+    return file_name
 
-        return response, file_name
 
 # Export a convenient list of public names
 __all__ = [
-    "IMAGES_DIR",
-    "process_message"
+    "ConversationSession",
+    "ProgressCallback",
+    "close_agent",
+    "get_agent",
+    "process_message",
+    "warm_up",
 ]
@@ -0,0 +1,108 @@
+import os
+import re
+import time
+import logging
+from collections import OrderedDict
+from typing import Optional
+
+from agents.genie_datasets import GenieDataset
+
+logger = logging.getLogger("microsoft_agents")
+
+# Result cache settings. A TTL of 0 disables caching.
+GENIE_CACHE_TTL_SECONDS = int(os.getenv("GENIE_CACHE_TTL_SECONDS", "300"))
+GENIE_CACHE_MAX_ENTRIES = int(os.getenv("GENIE_CACHE_MAX_ENTRIES", "500"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+# Result fields tied to the request that produced them, not stored with cached results: the Genie
+# conversation belongs to the Teams conversation that asked first, and a cache hit must not lead
+# another conversation's follow-ups into it; the dataset may have left the dataset store, which
+# keeps fewer entries than the cache, by the time of a hit. The dataset itself is cached instead
+# and stored again under a new id on each hit.
+_UNCACHED_FIELDS = ("conversation_id", "dataset_id")
+
+
+def normalize_question(question: str) -> str:
+    """
+    Normalize question text so trivially different phrasings of the same question share an entry.
+    """
+    return _WHITESPACE.sub(" ", question).strip().rstrip("?.!").strip().casefold()
+
+
+class GenieResultCache:
+    """
+    Exact-match cache of Genie results keyed by Genie space, normalized question and the caller's
+    data-access identity, each with the full dataset of its table when there is one. Entries expire
+    after a TTL and the cache is bounded by LRU eviction.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        # (space id, normalized question, identity) -> (stored at, result, dataset)
+        self._entries: "OrderedDict[tuple[str, str, str], tuple[float, dict, Optional[GenieDataset]]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def get(self, space_id: str, question: str, identity: str) -> Optional[tuple[dict, Optional[GenieDataset]]]:
+        if not self.enabled:
+            return None
+
+        key = (space_id, normalize_question(question), identity)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        stored_at, result, dataset = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self._entries[key]
+            return None
+
+        self._entries.move_to_end(key)
+        return result, dataset
+
+    def put(self, space_id: str, question: str, identity: str, result: dict, dataset: Optional[GenieDataset] = None) -> None:
+        if not self.enabled:
+            return
+
+        key = (space_id, normalize_question(question), identity)
+        result = {name: value for name, value in result.items() if name not in _UNCACHED_FIELDS}
+        self._entries[key] = (time.time(), result, dataset)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, space_id: Optional[str] = None) -> int:
+        """
+        Drop cached results for one Genie space, or all of them when no space is given.
+        Returns the number of entries removed.
+        """
+        if space_id is None:
+            removed = len(self._entries)
+            self._entries.clear()
+        else:
+            keys = [key for key in self._entries if key[0] == space_id]
+            for key in keys:
+                del self._entries[key]
+            removed = len(keys)
+
+        logger.info(f"Invalidated {removed} cached Genie results (space: {space_id or 'all'})")
+        return removed
+
+
+result_cache = GenieResultCache(GENIE_CACHE_TTL_SECONDS, GENIE_CACHE_MAX_ENTRIES)
+
+
+def invalidate(space_id: Optional[str] = None) -> int:
+    return result_cache.invalidate(space_id)
+
+
+__all__ = [
+    "GenieResultCache",
+    "invalidate",
+    "normalize_question",
+    "result_cache",
+]
@@ -0,0 +1,194 @@
+import os
+import asyncio
+import logging
+import importlib.util
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from agents.genie_datasets import GenieDataset
+
+logger = logging.getLogger("microsoft_agents")
+
+# Local charts: bar, line and pie charts of a Genie result are drawn in-process with matplotlib
+# (optional dependency) instead of by the model through the hosted code interpreter. Rendering runs
+# in a process pool so it never blocks the event loop.
+LOCAL_CHARTS = os.getenv("LOCAL_CHARTS", "false").lower() == "true"
+CHART_WORKERS = int(os.getenv("CHART_WORKERS", "2"))
+CHART_TIMEOUT_SECONDS = float(os.getenv("CHART_TIMEOUT_SECONDS", "30"))
+# Bar and pie charts with more categories than this are refused; line charts take any row count
+CHART_MAX_CATEGORIES = int(os.getenv("CHART_MAX_CATEGORIES", "100"))
+
+CHART_KINDS = ("bar", "line", "pie")
+
+# Added to the agent instructions when LOCAL_CHARTS is enabled
+LOCAL_CHART_INSTRUCTIONS = """
+### Charts
+
+- For bar, line and pie charts of data returned by Genie, call `render_chart_ai_function` with the result's `dataset_id` instead of writing code for the code interpreter. The chart is shown to the user below your answer; do not describe it as a file or link.
+- Use the code interpreter only for visualizations `render_chart_ai_function` cannot draw, or when it returns an error.
+"""
+
+# Fixed size, resolution and style so the same data always gives the same PNG bytes (and blob name)
+_FIGURE_SIZE = (8, 4.5)
+_DPI = 100
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class ChartError(ValueError):
+    """
+    Raised when a chart spec does not fit the dataset.
+    """
+
+
+def _init_worker() -> None:
+    # Import matplotlib once per worker with the headless backend
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot  # noqa: F401
+
+
+def _number(value: Optional[str]) -> float:
+    if value is None or value == "":
+        return float("nan")
+    return float(value)
+
+
+def render_png(kind: str, title: str, x_label: str, labels: list[str], series: dict[str, list[Optional[str]]]) -> bytes:
+    """
+    Draw a chart and return it as PNG bytes. Runs in a pool worker.
+    """
+    import io
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    values = {}
+    for name, column in series.items():
+        try:
+            values[name] = [_number(value) for value in column]
+        except ValueError:
+            raise ChartError(f"Column '{name}' is not numeric")
+
+    with plt.style.context("default"):
+        fig, ax = plt.subplots(figsize=_FIGURE_SIZE, dpi=_DPI)
+        try:
+            if kind == "pie":
+                ((name, column),) = values.items()
+                ax.pie(column, labels=labels, autopct="%1.1f%%", startangle=90, counterclock=False)
+                ax.axis("equal")
+            elif kind == "bar":
+                width = 0.8 / len(values)
+                for i, (name, column) in enumerate(values.items()):
+                    offsets = [p - 0.4 + width * (i + 0.5) for p in range(len(labels))]
+                    ax.bar(offsets, column, width=width, label=name)
+                ax.set_xticks(range(len(labels)), labels, rotation=45 if len(labels) > 8 else 0, ha="right" if len(labels) > 8 else "center")
+            else:
+                for name, column in values.items():
+                    ax.plot(range(len(labels)), column, marker="o" if len(labels) <= 50 else None, label=name)
+                step = max(1, len(labels) // 12)
+                ax.set_xticks(range(0, len(labels), step), labels[::step], rotation=45, ha="right")
+
+            if kind != "pie":
+                ax.set_xlabel(x_label)
+                if len(values) == 1:
+                    ax.set_ylabel(next(iter(values)))
+                else:
+                    ax.legend()
+                ax.grid(axis="y", alpha=0.3)
+            ax.set_title(title)
+            fig.tight_layout()
+
+            buffer = io.BytesIO()
+            # No software/date metadata, so the bytes only depend on the chart
+            fig.savefig(buffer, format="png", metadata={"Software": None})
+            return buffer.getvalue()
+        finally:
+            plt.close(fig)
+
+
+def chart_args(dataset: GenieDataset, kind: str, x: str, y: list[str], title: str = "") -> tuple:
+    """
+    Check a chart spec against a dataset and pick out the columns to draw, as arguments for render_png.
+    """
+    if kind not in CHART_KINDS:
+        raise ChartError(f"Unknown chart kind '{kind}' (expected {', '.join(CHART_KINDS)})")
+    if not y:
+        raise ChartError("At least one y column is required")
+    if kind == "pie" and len(y) != 1:
+        raise ChartError("A pie chart takes exactly one y column")
+
+    missing = [column for column in [x, *y] if column not in dataset.columns]
+    if missing:
+        raise ChartError(f"Unknown columns {missing}; the dataset has {dataset.columns}")
+    if kind != "line" and len(dataset.rows) > CHART_MAX_CATEGORIES:
+        raise ChartError(f"Too many categories for a {kind} chart ({len(dataset.rows)} > {CHART_MAX_CATEGORIES})")
+
+    index = {column: i for i, column in enumerate(dataset.columns)}
+    labels = ["" if row[index[x]] is None else str(row[index[x]]) for row in dataset.rows]
+    series = {column: [row[index[column]] for row in dataset.rows] for column in y}
+    return kind, title, x, labels, series
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        if importlib.util.find_spec("matplotlib") is None:
+            raise RuntimeError("LOCAL_CHARTS=true requires the matplotlib package (pip install matplotlib)")
+        # Workers come from a forkserver where available: forking the server itself would copy its
+        # threads' locks in whatever state they are in. Workers import the main module as __mp_main__;
+        # main.py imports the app only when a server is built, so they load little beyond this module.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(
+            max_workers=CHART_WORKERS, mp_context=multiprocessing.get_context(method), initializer=_init_worker
+        )
+    return _pool
+
+
+async def render_chart(dataset: GenieDataset, kind: str, x: str, y: list[str], title: str = "") -> bytes:
+    """
+    Render a chart of the dataset as PNG bytes in the chart process pool. Raises ChartError for a
+    spec that does not fit the dataset.
+    """
+    global _pool
+
+    args = chart_args(dataset, kind, x, y, title)
+    pool = _get_pool()
+    try:
+        return await asyncio.wait_for(asyncio.get_running_loop().run_in_executor(pool, render_png, *args), CHART_TIMEOUT_SECONDS)
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool for the next chart
+        if _pool is pool:
+            _pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+async def preload() -> None:
+    """
+    Start the pool workers so the first chart does not wait for matplotlib to import.
+    """
+    pool = _get_pool()
+    loop = asyncio.get_running_loop()
+    await asyncio.gather(*[loop.run_in_executor(pool, _init_worker) for _ in range(CHART_WORKERS)])
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+__all__ = [
+    "CHART_KINDS",
+    "ChartError",
+    "LOCAL_CHARTS",
+    "LOCAL_CHART_INSTRUCTIONS",
+    "preload",
+    "render_chart",
+    "render_png",
+    "shutdown_pool",
+]
@@ -0,0 +1,108 @@
+import os
+import re
+from typing import Iterable, Optional
+
+from agent_framework import AgentRunResponseUpdate, ChatMessage, Role, UsageContent
+
+# Bounded conversation context. A Foundry thread keeps every earlier question and answer (with its
+# tables) in the model context, so each turn of a long Teams conversation costs more than the last.
+# Once a thread gets too large the conversation moves to a fresh thread, seeded with the last few
+# exchanges verbatim and a rolling summary of the older ones.
+
+# Context size (input tokens of a run's largest model step) above which the next turn starts a fresh thread
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "16000"))
+# Turns on one thread before it is rolled over anyway (also used when the service reports no usage)
+CONTEXT_MAX_THREAD_TURNS = int(os.getenv("CONTEXT_MAX_THREAD_TURNS", "12"))
+# Exchanges carried over verbatim into a fresh thread
+CONTEXT_RECENT_TURNS = int(os.getenv("CONTEXT_RECENT_TURNS", "3"))
+# Longest answer carried over verbatim; tables in it are replaced by a one-line reference first
+CONTEXT_ANSWER_CHARS = int(os.getenv("CONTEXT_ANSWER_CHARS", "2000"))
+# Size of the summary of older exchanges; its oldest lines are dropped first
+CONTEXT_SUMMARY_CHARS = int(os.getenv("CONTEXT_SUMMARY_CHARS", "3000"))
+SUMMARY_ANSWER_CHARS = 200
+
+# A markdown table: a header row, a separator row and any number of body rows
+_MARKDOWN_TABLE = re.compile(r"(?m)^[ \t]*\|.*\|[ \t]*\n[ \t]*\|[ \t:\-|]+\|[ \t]*\n(?:[ \t]*\|.*\|[ \t]*(?:\n|$))*")
+
+
+def _table_reference(match: re.Match) -> str:
+    lines = match.group(0).strip().splitlines()
+    columns = [cell.strip() for cell in lines[0].strip().strip("|").split("|")]
+    return f"[table of {len(lines) - 2} rows: {', '.join(columns)}]\n"
+
+
+def compact_answer(text: str, max_chars: int = CONTEXT_ANSWER_CHARS) -> str:
+    """
+    Answer text with its markdown tables replaced by references, cut to max_chars. The data itself
+    can always be asked of Genie again.
+    """
+    text = _MARKDOWN_TABLE.sub(_table_reference, text).strip()
+    if len(text) > max_chars:
+        text = text[:max_chars].rstrip() + " [...]"
+    return text
+
+
+def record_turn(session, question: str, answer: str) -> None:
+    """
+    Add an exchange to the session's recent turns, folding the oldest recent turn into the summary.
+    """
+    session.recent_turns.append({"question": question, "answer": compact_answer(answer)})
+    while len(session.recent_turns) > CONTEXT_RECENT_TURNS:
+        turn = session.recent_turns.pop(0)
+        line = f"- Q: {turn['question']} A: {compact_answer(turn['answer'], SUMMARY_ANSWER_CHARS)}"
+        lines = (session.summary.splitlines() if session.summary else []) + [" ".join(line.split())]
+        while len(lines) > 1 and sum(len(l) + 1 for l in lines) > CONTEXT_SUMMARY_CHARS:
+            lines.pop(0)
+        session.summary = "\n".join(lines)
+
+
+def needs_rollover(session) -> bool:
+    """
+    Whether the session's thread has grown past the token budget or turn limit.
+    """
+    if not session.thread_id:
+        return False
+    return session.context_tokens > CONTEXT_TOKEN_BUDGET or session.thread_turns >= CONTEXT_MAX_THREAD_TURNS
+
+
+def seed_messages(session, question: str) -> list[ChatMessage]:
+    """
+    Messages for the first run of a fresh thread: the summary of older exchanges (as instructions),
+    the recent exchanges and the question.
+    """
+    messages: list[ChatMessage] = []
+    if session.summary:
+        # Appended to the agent instructions as is, hence the leading blank line
+        messages.append(ChatMessage(
+            role=Role.SYSTEM,
+            text="\n\n## Earlier in this conversation\n\n" + session.summary,
+        ))
+    for turn in session.recent_turns:
+        messages.append(ChatMessage(role=Role.USER, text=turn["question"]))
+        messages.append(ChatMessage(role=Role.ASSISTANT, text=turn["answer"]))
+    messages.append(ChatMessage(role=Role.USER, text=question))
+    return messages
+
+
+def input_tokens(updates: Iterable[AgentRunResponseUpdate]) -> Optional[int]:
+    """
+    Input tokens of the largest model step of a run, when the service reported them. Every step (tool
+    call, code interpreter, answer) reads the whole thread so far, so this is the size of the context;
+    the run's total usage counts it once per step.
+    """
+    counts = [
+        content.details.input_token_count
+        for update in updates
+        for content in update.contents or []
+        if isinstance(content, UsageContent) and content.details.input_token_count is not None
+    ]
+    return max(counts, default=None)
+
+
+__all__ = [
+    "compact_answer",
+    "input_tokens",
+    "needs_rollover",
+    "record_turn",
+    "seed_messages",
+]
@@ -0,0 +1,80 @@
+import os
+import time
+import uuid
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger("microsoft_agents")
+
+# Side store for full Genie results whose model-facing table was compacted. Local charts read the
+# complete rows from here by dataset id instead of from the model context. A TTL of 0 disables it.
+GENIE_DATASET_TTL_SECONDS = int(os.getenv("GENIE_DATASET_TTL_SECONDS", "900"))
+GENIE_DATASET_MAX_ENTRIES = int(os.getenv("GENIE_DATASET_MAX_ENTRIES", "64"))
+# Results with more rows than this are not kept
+GENIE_DATASET_MAX_ROWS = int(os.getenv("GENIE_DATASET_MAX_ROWS", "100000"))
+
+
+@dataclass
+class GenieDataset:
+    """
+    Complete result of a Genie statement, row-major with the raw (unformatted) values.
+    """
+    columns: list[str]
+    types: list[str]
+    rows: list[list[Optional[str]]]
+
+
+class GenieDatasetStore:
+    """
+    In-memory store of datasets keyed by a random id. A dataset is only returned to the identity
+    that stored it; entries expire after a TTL and the store is bounded by LRU eviction.
+    """
+
+    def __init__(self, ttl_seconds: int, max_entries: int, max_rows: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        # dataset id -> (stored at, identity, dataset)
+        self._entries: "OrderedDict[str, tuple[float, str, GenieDataset]]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0 and self.max_entries > 0
+
+    def put(self, identity: str, dataset: GenieDataset) -> Optional[str]:
+        if not self.enabled or len(dataset.rows) > self.max_rows:
+            return None
+
+        dataset_id = uuid.uuid4().hex
+        self._entries[dataset_id] = (time.time(), identity, dataset)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return dataset_id
+
+    def get(self, dataset_id: str, identity: str) -> Optional[GenieDataset]:
+        entry = self._entries.get(dataset_id)
+        if entry is None:
+            return None
+
+        stored_at, owner, dataset = entry
+        if time.time() - stored_at > self.ttl_seconds:
+            del self._entries[dataset_id]
+            return None
+        if owner != identity:
+            logger.warning(f"Genie dataset {dataset_id} requested by a different identity")
+            return None
+
+        self._entries.move_to_end(dataset_id)
+        return dataset
+
+
+dataset_store = GenieDatasetStore(GENIE_DATASET_TTL_SECONDS, GENIE_DATASET_MAX_ENTRIES, GENIE_DATASET_MAX_ROWS)
+
+
+__all__ = [
+    "GenieDataset",
+    "GenieDatasetStore",
+    "dataset_store",
+]
@@ -0,0 +1,110 @@
+from decimal import Decimal, InvalidOperation
+from typing import Callable, Optional, Sequence
+
+# Formatting of Genie statement results. Statement results (JSON_ARRAY format) carry every non-null
+# value as a string; each column gets one converter, chosen once from its type, that is applied to the
+# whole column instead of re-checking the type for every cell.
+
+NULL = "NULL"
+
+FLOAT_TYPES = {"DOUBLE", "FLOAT"}
+INTEGER_TYPES = {"INT", "BIGINT", "LONG", "SHORT", "BYTE"}
+NUMERIC_TYPES = FLOAT_TYPES | INTEGER_TYPES | {"DECIMAL"}
+
+DEFAULT_DECIMAL_SCALE = 2
+# Widest DECIMAL that round-trips exactly through a float
+FLOAT_SAFE_PRECISION = 15
+
+ValueFormatter = Callable[[str], str]
+ColumnFormatter = Callable[[Sequence[Optional[str]]], list[str]]
+
+
+def _format_float(value: str) -> str:
+    return f"{float(value):,.2f}"
+
+
+def _format_int(value: str) -> str:
+    return f"{int(value):,}"
+
+
+def _decimal_formatter(scale: Optional[int], precision: Optional[int]) -> ValueFormatter:
+    scale = DEFAULT_DECIMAL_SCALE if scale is None else scale
+    spec = f",.{scale}f"
+
+    if precision is not None and precision <= FLOAT_SAFE_PRECISION:
+        def format_narrow_decimal(value: str) -> str:
+            return format(float(value), spec)
+
+        return format_narrow_decimal
+
+    # Decimal keeps the exact value; floats would round wide DECIMAL(38, x) columns
+    def format_decimal(value: str) -> str:
+        try:
+            return format(Decimal(value), spec)
+        except InvalidOperation:
+            return value
+
+    return format_decimal
+
+
+def _format_boolean(value: str) -> str:
+    return "true" if value.lower() in ("true", "1") else "false"
+
+
+def _format_timestamp(value: str) -> str:
+    # 2024-05-01T13:45:00.000Z -> 2024-05-01 13:45:00
+    if len(value) >= 19 and value[10] == "T":
+        return f"{value[:10]} {value[11:19]}"
+    return value
+
+
+def value_formatter(type_name: str, scale: Optional[int] = None, precision: Optional[int] = None) -> Optional[ValueFormatter]:
+    """
+    Formatter for non-null values of a column type, or None when values are shown as-is
+    (strings, dates and anything without a dedicated format).
+    """
+    if type_name in FLOAT_TYPES:
+        return _format_float
+    if type_name in INTEGER_TYPES:
+        return _format_int
+    if type_name == "DECIMAL":
+        return _decimal_formatter(scale, precision)
+    if type_name == "BOOLEAN":
+        return _format_boolean
+    if type_name in ("TIMESTAMP", "TIMESTAMP_NTZ"):
+        return _format_timestamp
+    return None
+
+
+def column_formatter(type_name: str, scale: Optional[int] = None, precision: Optional[int] = None) -> ColumnFormatter:
+    """
+    Build a function that formats a whole column of raw values for display.
+    """
+    fmt = value_formatter(type_name, scale, precision)
+
+    if fmt is None:
+        def format_column(values: Sequence[Optional[str]]) -> list[str]:
+            return [NULL if value is None else value for value in values]
+    else:
+        def format_column(values: Sequence[Optional[str]]) -> list[str]:
+            return [NULL if value is None else fmt(value) for value in values]
+
+    return format_column
+
+
+def format_columns(rows: Sequence[Sequence[Optional[str]]], formatters: Sequence[ColumnFormatter]) -> list[list[str]]:
+    """
+    Transpose row-major raw values into columns and format each column with its formatter.
+    """
+    if not rows:
+        return [[] for _ in formatters]
+    return [fmt(column) for fmt, column in zip(formatters, zip(*rows))]
+
+
+__all__ = [
+    "NULL",
+    "NUMERIC_TYPES",
+    "column_formatter",
+    "format_columns",
+    "value_formatter",
+]
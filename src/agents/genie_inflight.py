@@ -0,0 +1,112 @@
+import os
+import asyncio
+import logging
+from typing import Awaitable, Callable, Hashable, Optional
+
+logger = logging.getLogger("microsoft_agents")
+
+# Single flight: concurrent identical Genie questions (same space, normalized question and identity)
+# share one Genie conversation and warehouse statement. Works with or without the result cache.
+GENIE_SINGLE_FLIGHT = os.getenv("GENIE_SINGLE_FLIGHT", "true").lower() == "true"
+
+StatusCallback = Callable[[str], Awaitable[None]]
+# Runs the shared request given the status callback and cancellation event of the flight
+FlightRunner = Callable[[StatusCallback, asyncio.Event], Awaitable[dict]]
+
+
+class _Flight:
+    """
+    One shared execution and the callers waiting on it.
+    """
+
+    def __init__(self):
+        self.waiters = 0
+        self.callbacks: list[StatusCallback] = []
+        # Set once every waiter has left, which abandons the Genie wait
+        self.cancelled = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    async def on_status(self, text: str) -> None:
+        for callback in list(self.callbacks):
+            try:
+                await callback(text)
+            except Exception as e:
+                logger.warning(f"Genie status callback failed: {e!r}")
+
+
+class InFlightRequests:
+    """
+    Table of in-flight Genie requests. The first caller for a key starts the request as its own task;
+    later callers with the same key wait on that task and receive the same result. Each caller can
+    stop waiting on its own; the request itself is only abandoned when no caller is left.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._flights: dict[Hashable, _Flight] = {}
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._flights
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def join(
+        self,
+        key: Hashable,
+        run: FlightRunner,
+        on_status: Optional[StatusCallback] = None,
+        cancelled: Optional[asyncio.Event] = None,
+    ) -> Optional[dict]:
+        """
+        Result of the request for key, starting it with run when none is in flight. Returns None
+        when `cancelled` is set before the result is ready.
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight()
+            flight.task = asyncio.create_task(run(flight.on_status, flight.cancelled))
+            flight.task.add_done_callback(lambda task: self._finish(key, flight))
+
+        flight.waiters += 1
+        if on_status is not None:
+            flight.callbacks.append(on_status)
+        try:
+            if cancelled is None:
+                # Shielded: a waiter being cancelled must not cancel the request the others wait on
+                return await asyncio.shield(flight.task)
+
+            waiter = asyncio.create_task(cancelled.wait())
+            try:
+                await asyncio.wait({flight.task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            return flight.task.result() if flight.task.done() else None
+        finally:
+            flight.waiters -= 1
+            if on_status is not None:
+                flight.callbacks.remove(on_status)
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody is waiting any more; later callers start afresh instead of joining
+                flight.cancelled.set()
+                self._remove(key, flight)
+
+    def _remove(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def _finish(self, key: Hashable, flight: _Flight) -> None:
+        self._remove(key, flight)
+        # Retrieve the outcome so an abandoned request that failed does not log "never retrieved"
+        if not flight.task.cancelled() and flight.task.exception() is not None and flight.waiters == 0:
+            logger.warning(f"Abandoned Genie request failed: {flight.task.exception()!r}")
+
+
+in_flight = InFlightRequests(GENIE_SINGLE_FLIGHT)
+
+
+__all__ = [
+    "GENIE_SINGLE_FLIGHT",
+    "InFlightRequests",
+    "in_flight",
+]
@@ -0,0 +1,76 @@
+import os
+import re
+from typing import Optional
+
+# Fast path: questions that only ask for data are sent straight to Genie and its table is rendered
+# locally, skipping the Foundry agent run. Anything that looks like it needs charts, analysis or
+# files goes through the agent as before.
+GENIE_FAST_PATH = os.getenv("GENIE_FAST_PATH", "false").lower() == "true"
+# Longer questions usually carry instructions the agent has to follow
+FAST_PATH_MAX_WORDS = int(os.getenv("FAST_PATH_MAX_WORDS", "30"))
+# Rows rendered in a fast-path answer; the rest are summarized below the table
+FAST_PATH_MAX_ROWS = int(os.getenv("FAST_PATH_MAX_ROWS", "50"))
+
+_AGENT_INTENT = re.compile(
+    r"\b("
+    r"chart|graph|plot|visuali[sz]\w*|diagram|image|picture|draw|"
+    r"trend\w*|analy[sz]\w*|insight\w*|explain\w*|why|interpret\w*|summari[sz]\w*|"
+    r"compar\w*|versus|vs|correlat\w*|forecast\w*|predict\w*|project\w*|recommend\w*|suggest\w*|"
+    r"csv|excel|download|export|file"
+    r")\b",
+    re.IGNORECASE,
+)
+
+
+def is_fast_path_question(question: str) -> bool:
+    """
+    Keyword rules: a short question without visualization, analysis or file intent.
+    """
+    return len(question.split()) <= FAST_PATH_MAX_WORDS and _AGENT_INTENT.search(question) is None
+
+
+def _cell(value: str) -> str:
+    return value.replace("|", "\\|").replace("\n", " ")
+
+
+def render_markdown_table(table: dict, max_rows: int = FAST_PATH_MAX_ROWS) -> str:
+    """
+    Render a column-major Genie table as a markdown table, noting rows that were left out.
+    """
+    columns, values = table["columns"], table["values"]
+    shown = min(len(values[0]) if values else 0, max_rows)
+
+    lines = [
+        "| " + " | ".join(_cell(column) for column in columns) + " |",
+        "|" + "---|" * len(columns),
+    ]
+    for r in range(shown):
+        lines.append("| " + " | ".join(_cell(column[r]) for column in values) + " |")
+
+    row_count = table.get("row_count", shown)
+    if row_count > shown:
+        lines.append("")
+        lines.append(f"Showing {shown:,} of {row_count:,} rows.")
+    return "\n".join(lines)
+
+
+def render_result(result: dict) -> Optional[str]:
+    """
+    Text answer for a Genie result, or None when the agent should handle the question instead.
+    """
+    if "error" in result:
+        return None
+    if "table" in result:
+        # No rows (or no columns) to show; the agent explains the empty result instead
+        if not result["table"]["columns"] or result["table"].get("row_count", 0) == 0:
+            return None
+        return render_markdown_table(result["table"])
+    return result.get("message")
+
+
+__all__ = [
+    "GENIE_FAST_PATH",
+    "is_fast_path_question",
+    "render_markdown_table",
+    "render_result",
+]
@@ -1,108 +1,609 @@
 import os
 from os import path
 import json
+import time
+import random
+import asyncio
+import hashlib
 import logging
-from dotenv import load_dotenv
-from typing import Any, Callable, Set
-from databricks.sdk import WorkspaceClient
-from databricks.sdk.service.dashboards import GenieAPI
+import functools
+import contextvars
+from collections import OrderedDict
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Iterator, Optional, Set
+import requests
+import utils
+import resilience
+import telemetry
+from agents.genie_cache import normalize_question, result_cache
+from agents.genie_inflight import in_flight
+import agents.genie_charts as charts
+from agents.genie_datasets import GENIE_DATASET_MAX_ROWS, GenieDataset, dataset_store
+from agents.genie_format import NUMERIC_TYPES, column_formatter, format_columns
 
-# Load environment variables from .env located in the parent directory
-load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), ".env"))
+# The Databricks SDK takes about a second to import; it is loaded on first use (or by preload)
+if TYPE_CHECKING:
+    from databricks.sdk import WorkspaceClient
+    from databricks.sdk.service.dashboards import GenieAPI, GenieMessage
 
 logger = logging.getLogger("microsoft_agents")
 
-# Ask Genie: wrap the Databricks Genie APIs and return structured JSON
-async def ask_genie(question: str, conversation_id: str = None, genie_workspaceid: str = None, adbtoken: str = None) -> str:
+# The Databricks SDK is synchronous; its calls run on this bounded pool so they never block the event loop.
+# GENIE_MAX_CONCURRENCY caps how many Databricks calls are in flight per process.
+GENIE_MAX_CONCURRENCY = int(os.getenv("GENIE_MAX_CONCURRENCY", "16"))
+_executor = ThreadPoolExecutor(max_workers=GENIE_MAX_CONCURRENCY, thread_name_prefix="genie")
+
+
+async def _run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Run a blocking SDK call on the Genie executor, carrying the caller's context variables along.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(ctx.run, func, *args, **kwargs))
+
+
+def shutdown_executor() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Retries are handled by the resilience layer (bounded by the turn deadline); the SDK's own retry
+# loop is kept short so it doesn't silently hold a worker for minutes.
+GENIE_SDK_RETRY_TIMEOUT_SECONDS = int(os.getenv("GENIE_SDK_RETRY_TIMEOUT_SECONDS", "10"))
+# Longest a Genie message may take when no turn deadline applies
+GENIE_WAIT_TIMEOUT = timedelta(minutes=20)
+
+# Genie message polling: the interval starts short (simple questions finish in a couple of seconds)
+# and grows by GENIE_POLL_BACKOFF up to GENIE_POLL_MAX_SECONDS for long-running warehouse queries
+GENIE_POLL_INITIAL_SECONDS = float(os.getenv("GENIE_POLL_INITIAL_SECONDS", "0.5"))
+GENIE_POLL_MAX_SECONDS = float(os.getenv("GENIE_POLL_MAX_SECONDS", "5"))
+GENIE_POLL_BACKOFF = float(os.getenv("GENIE_POLL_BACKOFF", "1.5"))
+
+# Genie message states (MessageStatus values)
+GENIE_FAILED_STATES = ("FAILED", "CANCELLED", "QUERY_RESULT_EXPIRED")
+
+# Progress text for the Genie message states worth telling the user about
+GENIE_STATUS_TEXT = {
+    "FILTERING_CONTEXT": "Genie is reading your question...",
+    "FETCHING_METADATA": "Genie is looking up the data...",
+    "ASKING_AI": "Genie is writing a query...",
+    "PENDING_WAREHOUSE": "Waiting for the SQL warehouse to start...",
+    "EXECUTING_QUERY": "Genie is running the query...",
+}
+
+# Called with a progress text whenever a Genie message moves to a new state
+StatusCallback = Callable[[str], Awaitable[None]]
+
+
+class GenieWaitCancelled(Exception):
+    """
+    Raised when a Genie wait is abandoned because the user sent a newer message.
+    """
+
+
+class GenieMessageFailed(Exception):
+    """
+    Raised when a Genie message ends in a failed, cancelled or expired state.
+    """
+
+
+async def _call_genie(space_id: str, func: Callable[..., Any], *args, idempotent: bool = True, **kwargs) -> Any:
+    """
+    Run a blocking Genie/statement call on the executor behind the Genie space's circuit breaker.
+    Only idempotent calls are retried: a retried start_conversation or create_message could post the
+    question twice.
+    """
+    max_attempts = resilience.RETRY_MAX_ATTEMPTS if idempotent else 1
+    return await resilience.call_with_retry(
+        _run_blocking, func, *args, dependency=f"genie:{space_id}", max_attempts=max_attempts, **kwargs
+    )
+
+
+def _call_genie_sync(space_id: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Blocking form of _call_genie for idempotent reads made on the Genie executor.
+    """
+    return resilience.call_with_retry_sync(func, *args, dependency=f"genie:{space_id}", **kwargs)
+
+
+async def _wait_for_message(
+    genie_api: "GenieAPI",
+    space_id: str,
+    conversation_id: str,
+    message_id: str,
+    on_status: Optional[StatusCallback] = None,
+    cancelled: Optional[asyncio.Event] = None,
+) -> "GenieMessage":
+    """
+    Poll a Genie message until it completes. Waits between polls are async and grow from
+    GENIE_POLL_INITIAL_SECONDS to GENIE_POLL_MAX_SECONDS; the wait ends at the turn deadline, or
+    immediately when `cancelled` is set.
+    """
+    remaining = resilience.remaining_time()
+    deadline = time.monotonic() + (GENIE_WAIT_TIMEOUT.total_seconds() if remaining is None else remaining)
+    interval = GENIE_POLL_INITIAL_SECONDS
+    last_status = None
+
+    while True:
+        message = await _call_genie(space_id, genie_api.get_message, space_id, conversation_id, message_id)
+        status = message.status.value if message.status else None
+
+        if status == "COMPLETED":
+            return message
+        if status in GENIE_FAILED_STATES:
+            error = message.error.error if message.error else None
+            raise GenieMessageFailed(f"Genie message {status}: {error or 'no details'}")
+
+        if status != last_status:
+            last_status = status
+            logger.debug(f"Genie message {message_id}: {status}")
+            if on_status is not None and status in GENIE_STATUS_TEXT:
+                await on_status(GENIE_STATUS_TEXT[status])
+
+        # Jittered so many waits started together don't poll in lockstep
+        delay = interval * random.uniform(0.8, 1.2)
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise resilience.DeadlineExceeded(f"Genie message {message_id} still {status} at the deadline")
+        delay = min(delay, left)
+
+        if cancelled is None:
+            await asyncio.sleep(delay)
+        else:
+            try:
+                await asyncio.wait_for(cancelled.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+            else:
+                raise GenieWaitCancelled(f"Stopped waiting for Genie message {message_id}")
+
+        interval = min(interval * GENIE_POLL_BACKOFF, GENIE_POLL_MAX_SECONDS)
+
+
+# Databricks clients are cached per user token so repeated Genie calls reuse warm connection pools.
+# Entries are dropped when the token expires or when the cache exceeds its size bound (LRU), and
+# their connection pools closed.
+GENIE_CLIENT_CACHE_MAX_ENTRIES = int(os.getenv("GENIE_CLIENT_CACHE_MAX_ENTRIES", "256"))
+GENIE_CLIENT_DEFAULT_TTL_SECONDS = 3600
+
+# sha256(token) -> (workspace client, genie api, expires at)
+_client_cache: "OrderedDict[str, tuple[WorkspaceClient, GenieAPI, float]]" = OrderedDict()
+
+
+def preload() -> None:
+    """
+    Import the Databricks SDK ahead of the first question. Blocking; run it off the event loop.
+    """
+    import databricks.sdk.service.dashboards  # noqa: F401
+
+
+def _close_workspace_client(workspace_client: "WorkspaceClient") -> None:
+    # The SDK has no close(); its requests session sits on the internal base client. Closing it
+    # closes idle pooled sockets right away, and the sockets of calls still in flight as they finish.
+    session = getattr(getattr(workspace_client.api_client, "_api_client", None), "_session", None)
+    if session is not None:
+        session.close()
+
+
+def _evict_clients(now: float) -> None:
+    for key in [key for key, (_, _, expires_at) in _client_cache.items() if expires_at <= now]:
+        _close_workspace_client(_client_cache.pop(key)[0])
+    while len(_client_cache) > GENIE_CLIENT_CACHE_MAX_ENTRIES:
+        _close_workspace_client(_client_cache.popitem(last=False)[1][0])
+
+
+def close_clients() -> None:
+    """
+    Close the connection pools of every cached Databricks client, on shutdown.
+    """
+    while _client_cache:
+        _close_workspace_client(_client_cache.popitem()[1][0])
+
+
+def _new_workspace_client(adbtoken: str) -> "WorkspaceClient":
+    from databricks.sdk import WorkspaceClient
+    from databricks.sdk.config import Config
+
+    config = Config(
+        host=os.getenv("DATABRICKS_HOST", ""),
+        token=adbtoken,
+        retry_timeout_seconds=GENIE_SDK_RETRY_TIMEOUT_SECONDS,
+    )
+    return WorkspaceClient(config=config)
+
+
+async def _get_clients(adbtoken: str) -> tuple["WorkspaceClient", "GenieAPI"]:
+    """
+    Return the cached WorkspaceClient/GenieAPI pair for a token, building one on a miss.
+    """
+    key = hashlib.sha256(adbtoken.encode("utf-8")).hexdigest()
+    now = time.time()
+
+    cached = _client_cache.get(key)
+    if cached and cached[2] > now:
+        _client_cache.move_to_end(key)
+        return cached[0], cached[1]
+
+    # WorkspaceClient uses the adbtoken (OBO token) to authenticate
+    workspace_client = await _run_blocking(_new_workspace_client, adbtoken)
+    genie_api = workspace_client.genie
+    expires_at = utils.token_expiry(adbtoken) or now + GENIE_CLIENT_DEFAULT_TTL_SECONDS
+
+    _client_cache[key] = (workspace_client, genie_api, expires_at)
+    _evict_clients(now)
+    return workspace_client, genie_api
+
+# Maximum number of rows handed to the model; the rest of the result is summarized
+GENIE_MAX_ROWS = int(os.getenv("GENIE_MAX_ROWS", "500"))
+# Estimated model tokens one Genie table may take; rows past the budget are summarized instead
+GENIE_RESULT_TOKEN_BUDGET = int(os.getenv("GENIE_RESULT_TOKEN_BUDGET", "4000"))
+# Rough size of JSON table data per token, and room kept per column for the summaries
+CHARS_PER_TOKEN = 4
+SUMMARY_CHARS_PER_COLUMN = 100
+# Distinct values counted per column before the count is reported as a lower bound
+DISTINCT_LIMIT = 1000
+EXTERNAL_LINK_TIMEOUT_SECONDS = 60
+
+
+def _type_name(column) -> str:
+    # type_name is a ColumnInfoTypeName enum in the SDK; compare on its string value
+    type_name = column.type_name
+    return getattr(type_name, "value", type_name) or "STRING"
+
+
+def _fetch_external_link(url: str) -> list[list]:
+    # Pre-signed cloud storage URL: must be fetched without the Databricks auth header
+    response = requests.get(url, timeout=EXTERNAL_LINK_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    return response.json()
+
+
+def _iter_statement_rows(workspace_client: "WorkspaceClient", space_id: str, statement) -> Iterator[list]:
+    """
+    Yield the rows of a statement result chunk by chunk, following next_chunk_index and downloading
+    EXTERNAL_LINKS chunks, so only one chunk is held in memory at a time. Each chunk fetch is
+    retried on its own.
+    """
+    chunk = statement.result
+    while chunk is not None:
+        next_chunk_index = chunk.next_chunk_index
+
+        if chunk.data_array:
+            yield from chunk.data_array
+        for link in chunk.external_links or []:
+            yield from _call_genie_sync(space_id, _fetch_external_link, link.external_link)
+            next_chunk_index = link.next_chunk_index
+
+        if next_chunk_index is None:
+            break
+        chunk = _call_genie_sync(
+            space_id, workspace_client.statement_execution.get_statement_result_chunk_n, statement.statement_id, next_chunk_index
+        )
+
+
+def _add_row_stats(stats: dict[int, dict[str, float]], row: list, numeric: list[int]) -> None:
+    # Fold a row into the running min/max/sum of the numeric columns
+    for i in numeric:
+        if row[i] is None:
+            continue
+        number = float(row[i])
+        col_stats = stats.get(i)
+        if col_stats is None:
+            stats[i] = {"min": number, "max": number, "sum": number}
+        else:
+            col_stats["min"] = min(col_stats["min"], number)
+            col_stats["max"] = max(col_stats["max"], number)
+            col_stats["sum"] += number
+
+
+def _rows_within_budget(values: list[list[str]], fixed_chars: int, budget_tokens: int) -> int:
+    """
+    Number of leading rows of a column-major table whose JSON encoding fits the token budget.
+    """
+    limit = budget_tokens * CHARS_PER_TOKEN - fixed_chars
+    row_count = len(values[0]) if values else 0
+    used = 0
+    for r in range(row_count):
+        # Each cell costs its text plus quotes and a separator
+        used += sum(len(column[r]) + 3 for column in values)
+        if used > limit:
+            return r
+    return row_count
+
+
+def _read_statement_table(
+    workspace_client: "WorkspaceClient", space_id: str, statement_id: str, keep_dataset: bool = False
+) -> tuple[dict, Optional[GenieDataset]]:
+    """
+    Fetch a statement result and encode it column by column for the model. Rows are kept up to
+    GENIE_MAX_ROWS and then only as many as fit GENIE_RESULT_TOKEN_BUDGET; for the rows left out the
+    table carries the row count, min/max/sum of numeric columns and distinct counts. The complete
+    result is returned alongside as a dataset when the table was compacted, or always with
+    keep_dataset. Blocking; runs on the Genie executor, retrying each statement and chunk fetch.
+    """
+    with telemetry.phase("genie.get_statement", statement_id=statement_id):
+        statement = _call_genie_sync(space_id, workspace_client.statement_execution.get_statement, statement_id)
+
+    columns = statement.manifest.schema.columns
+    headers = [col.name for col in columns]
+    types = [_type_name(col) for col in columns]
+    formatters = [
+        column_formatter(type_name, col.type_scale, col.type_precision) for type_name, col in zip(types, columns)
+    ]
+    numeric = [i for i, type_name in enumerate(types) if type_name in NUMERIC_TYPES]
+
+    rows: list[list] = []
+    # Rows past GENIE_MAX_ROWS, kept for the dataset until there are too many to store (and not at
+    # all when the dataset store is disabled)
+    overflow: Optional[list[list]] = [] if dataset_store.enabled else None
+    remainder = 0
+    stats: dict[int, dict[str, float]] = {}
+    distinct: list[set] = [set() for _ in headers]
+
+    with telemetry.phase("genie.read_rows") as span:
+        for row in _iter_statement_rows(workspace_client, space_id, statement):
+            for i, value in enumerate(row):
+                if len(distinct[i]) <= DISTINCT_LIMIT:
+                    distinct[i].add(value)
+
+            if len(rows) < GENIE_MAX_ROWS:
+                rows.append(row)
+                continue
+
+            remainder += 1
+            _add_row_stats(stats, row, numeric)
+            if overflow is not None:
+                overflow.append(row)
+                if len(rows) + len(overflow) > GENIE_DATASET_MAX_ROWS:
+                    overflow = None
+        span.set_attribute("genie.row_count", len(rows) + remainder)
+
+    with telemetry.phase("genie.format_result", columns=len(headers), rows=len(rows)) as span:
+        values = format_columns(rows, formatters)
+
+        # Keep the rows that fit the token budget, leaving room for headers and column summaries
+        fixed_chars = len(json.dumps([headers, types])) + SUMMARY_CHARS_PER_COLUMN * len(headers)
+        kept = _rows_within_budget(values, fixed_chars, GENIE_RESULT_TOKEN_BUDGET)
+        if kept < len(rows):
+            values = [column[:kept] for column in values]
+            for row in rows[kept:]:
+                _add_row_stats(stats, row, numeric)
+            remainder += len(rows) - kept
+        span.set_attribute("genie.rows_kept", kept)
+
+    table = {
+        "columns": headers,
+        "types": types,
+        # Column-major: values[i] holds every returned value of columns[i]
+        "values": values,
+        "row_count": kept + remainder,
+    }
+    if not remainder:
+        return table, GenieDataset(columns=headers, types=types, rows=rows) if keep_dataset and dataset_store.enabled else None
+
+    table["truncated"] = True
+    table["omitted_rows"] = {
+        "row_count": remainder,
+        "columns": {headers[i]: col_stats for i, col_stats in stats.items()},
+    }
+    # Over every row; a count past DISTINCT_LIMIT is only a lower bound
+    table["distinct_counts"] = {
+        header: len(values_seen) if len(values_seen) <= DISTINCT_LIMIT else f">{DISTINCT_LIMIT}"
+        for header, values_seen in zip(headers, distinct)
+    }
+
+    dataset = None
+    if overflow is not None:
+        dataset = GenieDataset(columns=headers, types=types, rows=rows + overflow)
+    return table, dataset
+
+
+# Ask Genie: wrap the Databricks Genie APIs and return the structured result. on_status receives
+# progress text while Genie works; setting `cancelled` abandons the wait. Concurrent identical
+# questions that start a new conversation share one Genie execution (see genie_inflight).
+async def ask_genie_result(
+    question: str,
+    conversation_id: str = None,
+    genie_workspaceid: str = None,
+    adbtoken: str = None,
+    on_status: Optional[StatusCallback] = None,
+    cancelled: Optional[asyncio.Event] = None,
+) -> dict:
     if genie_workspaceid:
         logger.info(f"Using provided genie_workspaceid: {genie_workspaceid}")
 
     if adbtoken is None:
         error_msg = "ADB token not provided. Cannot authenticate to Databricks."
         logger.error(error_msg)
-        return json.dumps({
+        return {
             "error": error_msg,
             "details": "No adbtoken available from parameters."
-        })
+        }
 
     if genie_workspaceid is None:
         error_msg = "Genie workspace ID not configured. Please check your AI Foundry connection setup."
         logger.error(error_msg)
-        return json.dumps({
+        return {
             "error": error_msg,
             "details": "No genie_workspaceid available from configuration or parameters."
-        })
+        }
     
-    DATABRICKS_HOST = os.getenv("DATABRICKS_HOST", "")
     logger.info(f"Asking Genie: '{question}' (workspace: {genie_workspaceid})")
 
-    # WorkspaceClient uses the current adbtoken (OBO token) to authenticate
-    workspace_client = WorkspaceClient(host=DATABRICKS_HOST, token=adbtoken)
-    genie_api = GenieAPI(workspace_client.api_client)
+    # Only questions that start a new conversation are cacheable; follow-ups depend on earlier context
+    identity = utils.token_identity(adbtoken)
+    cache_result = conversation_id is None
+    if cache_result:
+        cached = result_cache.get(genie_workspaceid, question, identity)
+        if cached is not None:
+            logger.info(f"Genie result cache hit (workspace: {genie_workspaceid})")
+            result, dataset = cached
+            return _with_dataset(result, identity, dataset)
 
+    if not cache_result or not in_flight.enabled:
+        return await _ask_genie_once(question, conversation_id, genie_workspaceid, adbtoken, identity, on_status, cancelled)
+
+    # Identical questions already in flight share that Genie execution instead of starting another
+    key = (genie_workspaceid, normalize_question(question), identity)
+    joined = key in in_flight
+    if joined:
+        logger.info(f"Joining in-flight Genie request (workspace: {genie_workspaceid})")
+
+    async def run(flight_status: StatusCallback, flight_cancelled: asyncio.Event) -> dict:
+        return await _ask_genie_once(question, None, genie_workspaceid, adbtoken, identity, flight_status, flight_cancelled)
+
+    with telemetry.phase("genie.single_flight", space_id=genie_workspaceid, joined=joined):
+        result = await in_flight.join(key, run, on_status, cancelled)
+    if result is None:
+        return _cancelled_result("Stopped waiting for a shared Genie request")
+    if joined:
+        # The Genie conversation stays with the caller that started it; follow-ups of the others
+        # start their own instead of racing on it
+        result = {name: value for name, value in result.items() if name != "conversation_id"}
+    return result
+
+
+def _with_dataset(result: dict, identity: str, dataset: Optional[GenieDataset]) -> dict:
+    # Store the dataset under a new id for this request; a cached dataset's earlier id may be gone
+    if dataset is None:
+        return result
+    dataset_id = dataset_store.put(identity, dataset)
+    if dataset_id is None:
+        return result
+    return {**result, "dataset_id": dataset_id}
+
+
+def _cancelled_result(details: str) -> dict:
+    return {"error": "Cancelled because the user sent a newer message. Do not retry.", "details": details}
+
+
+async def _ask_genie_once(
+    question: str,
+    conversation_id: Optional[str],
+    genie_workspaceid: str,
+    adbtoken: str,
+    identity: str,
+    on_status: Optional[StatusCallback] = None,
+    cancelled: Optional[asyncio.Event] = None,
+) -> dict:
+    """
+    Run one Genie exchange and read its result, caching results of new conversations.
+    """
+    cache_result = conversation_id is None
     try:
+        workspace_client, genie_api = await _get_clients(adbtoken)
+
         if conversation_id is None:
-            message = genie_api.start_conversation_and_wait(genie_workspaceid, question)
-            conversation_id = message.conversation_id
+            with telemetry.phase("genie.start_conversation", space_id=genie_workspaceid):
+                pending = await _call_genie(
+                    genie_workspaceid, genie_api.start_conversation, genie_workspaceid, question, idempotent=False
+                )
+            conversation_id = pending.conversation_id
         else:
-            message = genie_api.create_message_and_wait(genie_workspaceid, conversation_id, question)
+            with telemetry.phase("genie.create_message", space_id=genie_workspaceid):
+                pending = await _call_genie(
+                    genie_workspaceid, genie_api.create_message, genie_workspaceid, conversation_id, question, idempotent=False
+                )
 
-        query_result = None
-        if message.query_result:
-            query_result = genie_api.get_message_query_result(
-                genie_workspaceid, message.conversation_id, message.id
+        # The completed message carries the attachments and query result reference
+        with telemetry.phase("genie.wait", space_id=genie_workspaceid):
+            message_content = await _wait_for_message(
+                genie_api, genie_workspaceid, conversation_id, pending.message_id, on_status, cancelled
             )
 
-        message_content = genie_api.get_message(genie_workspaceid, message.conversation_id, message.id)
+        query_result = None
+        if message_content.query_result:
+            with telemetry.phase("genie.get_message_query_result", space_id=genie_workspaceid):
+                query_result = await _call_genie(
+                    genie_workspaceid, genie_api.get_message_query_result, genie_workspaceid, conversation_id, pending.message_id
+                )
 
         # Try to parse structured data if available
         if query_result and query_result.statement_response:
             statement_id = query_result.statement_response.statement_id
-            results = workspace_client.statement_execution.get_statement(statement_id)
-
-            columns = results.manifest.schema.columns
-            data = results.result.data_array
-
-            # Format as markdown table
-            headers = [col.name for col in columns]
-            rows = []
-            for row in data:
-                formatted_row = []
-                for value, col in zip(row, columns):
-                    if value is None:
-                        formatted_value = "NULL"
-                    elif col.type_name in ["DECIMAL", "DOUBLE", "FLOAT"]:
-                        formatted_value = f"{float(value):,.2f}"
-                    elif col.type_name in ["INT", "BIGINT", "LONG"]:
-                        formatted_value = f"{int(value):,}"
-                    else:
-                        formatted_value = str(value)
-                    formatted_row.append(formatted_value)
-                rows.append(formatted_row)
-
-            return json.dumps({
+            # Not retried as a whole: the statement and chunk fetches inside are retried one by one
+            table, dataset = await _run_blocking(
+                _read_statement_table, workspace_client, genie_workspaceid, statement_id, charts.LOCAL_CHARTS
+            )
+
+            result = {
                 "conversation_id": conversation_id,
-                "table": {"columns": headers, "rows": rows},
-            })
+                "table": table,
+            }
+            # The full rows of a compacted table stay out of the model context; local charts draw any
+            # table from its dataset, so the cache keeps it for them
+            if cache_result:
+                result_cache.put(genie_workspaceid, question, identity, result, dataset if charts.LOCAL_CHARTS else None)
+            return _with_dataset(result, identity, dataset)
 
         # Fallback to plain message text
         if message_content.attachments:
             for attachment in message_content.attachments:
                 if attachment.text and attachment.text.content:
-                    return json.dumps({
+                    result = {
                         "conversation_id": conversation_id,
                         "message": attachment.text.content,
-                    })
+                    }
+                    if cache_result:
+                        result_cache.put(genie_workspaceid, question, identity, result)
+                    return result
 
-        return json.dumps({
+        return {
             "conversation_id": conversation_id,
             "message": message_content.content or "No content returned.",
-        })
+        }
+
+    except resilience.CircuitOpenError as e:
+        logger.warning(f"Ask Genie skipped: {e}")
+        return {"error": "Genie is temporarily unavailable. Do not retry; tell the user to try again shortly.", "details": str(e)}
+
+    except GenieWaitCancelled as e:
+        logger.info(f"Ask Genie cancelled: {e}")
+        return _cancelled_result(str(e))
+
+    except resilience.DeadlineExceeded as e:
+        logger.warning(f"Ask Genie ran out of time: {e}")
+        return {"error": "Genie did not answer in time. Do not retry; tell the user to try again or narrow the question.", "details": str(e)}
 
     except Exception as e:
         logger.error(f"Ask Genie failed: {e}")
-        return json.dumps({"error": "An error occurred while talking to Genie.", "details": str(e)})
+        return {"error": "An error occurred while talking to Genie.", "details": str(e)}
+
 
+async def ask_genie_many_result(
+    questions: list[str],
+    genie_workspaceid: str = None,
+    adbtoken: str = None,
+    on_status: Optional[StatusCallback] = None,
+    cancelled: Optional[asyncio.Event] = None,
+    limit: Optional[asyncio.Semaphore] = None,
+) -> list[dict]:
+    """
+    Ask several independent questions concurrently, each in a new Genie conversation (Genie answers
+    one message of a conversation at a time). At most `limit` questions are in flight; results
+    come back in the order of `questions`.
+    """
+    async def ask(question: str) -> dict:
+        if limit is None:
+            return await ask_genie_result(question, None, genie_workspaceid, adbtoken, on_status, cancelled)
+        async with limit:
+            return await ask_genie_result(question, None, genie_workspaceid, adbtoken, on_status, cancelled)
+
+    with telemetry.phase("genie.fan_out", questions=len(questions)):
+        return list(await asyncio.gather(*[ask(question) for question in questions]))
+
+
+def result_to_json(result: dict) -> str:
+    """
+    Compact JSON encoding of a Genie result, as handed to the model.
+    """
+    return json.dumps(result, separators=(",", ":"))
+
+
+# JSON form of ask_genie_result
+async def ask_genie(question: str, conversation_id: str = None, genie_workspaceid: str = None, adbtoken: str = None) -> str:
+    return result_to_json(await ask_genie_result(question, conversation_id, genie_workspaceid, adbtoken))
 
 
 # Expose the set of functions the agent may call
@@ -110,5 +611,14 @@ genie_funcs: Set[Callable[..., Any]] = {ask_genie}
 
 __all__ = [
     "ask_genie",
+    "ask_genie_many_result",
+    "ask_genie_result",
+    "close_clients",
+    "GenieWaitCancelled",
+    "GENIE_STATUS_TEXT",
+    "StatusCallback",
     "genie_funcs",
+    "preload",
+    "result_to_json",
+    "shutdown_executor",
 ]
@@ -1,11 +1,25 @@
 import re
+import time
+import asyncio
 import traceback
-import agents.genie_agent as agent
-import utils
+from contextlib import asynccontextmanager
+from datetime import timedelta
+from typing import AsyncIterator, Awaitable, Callable, Optional
 import os
 from os import environ, path
 from dotenv import load_dotenv
 
+# Load environment variables from .env located next to this module. The modules below read their
+# settings when imported, so this has to come first.
+load_dotenv(path.join(path.dirname(__file__), ".env"))
+
+import agents.genie_agent as agent
+import utils
+import resilience
+import telemetry
+from admission import admission, AdmissionRejected
+from state_storage import StorageConflictError, create_storage
+
 from microsoft_agents.activity import ActivityTypes, Attachment
 from microsoft_agents.hosting.core import TurnContext, TurnState, MessageFactory
 from microsoft_agents.hosting.aiohttp import CloudAdapter
@@ -14,16 +28,12 @@ from microsoft_agents.activity import load_configuration_from_env
 
 from microsoft_agents.hosting.core import (
     TurnState,
-    MemoryStorage,
     AgentApplication,
     Authorization
 )
 
 import logging
 
-# Load environment variables from .env located next to this module
-load_dotenv(path.join(path.dirname(__file__), ".env"))
-
 # Logging setup (keeps parity with previous app.py behavior)
 logger = logging.getLogger("microsoft_agents")
 console_handler = logging.StreamHandler()
@@ -41,20 +51,19 @@ elif loglevel == "ERROR":
 else:
     logger.setLevel(logging.WARNING)
 
-# Import and setup tracing
+# Import tracing; it is set up when the server starts (see start_background_tasks)
 try:
-    from tracing_config import setup_agent_tracing
-    setup_agent_tracing()
-    logger.info("Starting M365 agent with tracing enabled")
+    from tracing_config import setup_agent_tracing, shutdown_tracing
 except ImportError:
+    setup_agent_tracing = shutdown_tracing = None
     logger.warning("Tracing configuration not available")
-    logger.info("Starting M365 agent without tracing")
 
 # Load agent SDK configuration from environment (same behavior as original app)
 agents_sdk_config = load_configuration_from_env(environ)
 
-# Storage and connection manager
-STORAGE = MemoryStorage()
+# Storage (see STATE_STORAGE: shared between workers and replicas unless in memory; connects on first
+# use) and connection manager
+STORAGE = create_storage()
 CONNECTION_MANAGER = MsalConnectionManager(**agents_sdk_config)
 ADAPTER = CloudAdapter(connection_manager=CONNECTION_MANAGER)
 AUTHORIZATION = Authorization(STORAGE, CONNECTION_MANAGER, **agents_sdk_config)
@@ -67,9 +76,75 @@ AGENT_APP = AgentApplication[TurnState](
     **agents_sdk_config,
 )
 
+# Stream tool status and response text to the client as the agent works (Teams/Direct Line);
+# other channels receive the complete reply as a single message.
+STREAMING_RESPONSES = os.getenv("STREAMING_RESPONSES", "true").lower() == "true"
+THINKING_MESSAGE = "Agent is thinking...Thanks for being patient..."
+QUEUED_MESSAGE = "Lots of questions right now, yours is next in line..."
+BUSY_MESSAGE = "The agent is handling too many requests right now. Please try again in a minute."
+SUPERSEDED_MESSAGE = "Skipped this question to answer your newer one."
+
+# Conversation state properties holding the Genie conversation / Foundry thread of each user of a Teams
+# conversation (see _session_property)
+GENIE_SESSION_STATE = "genie_session"
+# Attempts at saving a session while overlapping turns of the conversation keep saving theirs first
+SESSION_SAVE_ATTEMPTS = 3
+
 STORAGE_ACCTNAME = os.getenv("STORAGE_ACCTNAME", "")
 STORAGE_CONTNAME = os.getenv("STORAGE_CONTNAME", "")
 
+# Chart images are deleted once unused for CHART_RETENTION_HOURS (0 keeps them forever)
+CHART_RETENTION_HOURS = float(os.getenv("CHART_RETENTION_HOURS", "24"))
+CHART_SWEEP_INTERVAL_MINUTES = float(os.getenv("CHART_SWEEP_INTERVAL_MINUTES", "60"))
+
+_background_tasks: list[asyncio.Task] = []
+
+# Background warm-up of the clients the first turns need, reported by /ready. A step that fails or
+# times out is initialized again on first use.
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "60"))
+_warmup_status: dict[str, str] = {}
+_warmup_done = not WARMUP_ENABLED
+
+# Cancellation event of the latest turn of each user in each conversation (see _conversation_key). A new
+# message sets the previous turn's event so it stops waiting on Genie instead of answering a question
+# the user has moved on from.
+_pending_turns: dict[tuple[str, str], asyncio.Event] = {}
+
+
+class _ConversationTurns:
+    """
+    Turns of one user in one conversation waiting to run the agent. They run one at a time, since a superseded
+    turn's Foundry run keeps the thread busy until it ends. `session` is the session the last turn
+    left behind, which a waiting turn takes over: its own turn state was loaded before that was saved.
+    """
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.waiting = 0
+        self.session: Optional["agent.ConversationSession"] = None
+
+
+_conversation_turns: dict[tuple[str, str], _ConversationTurns] = {}
+
+
+@asynccontextmanager
+async def _conversation_turn(conversation_key: tuple[str, str]) -> AsyncIterator[_ConversationTurns]:
+    """
+    Hold the conversation's turn lock once the turns before this one are done.
+    """
+    turns = _conversation_turns.get(conversation_key)
+    if turns is None:
+        turns = _conversation_turns[conversation_key] = _ConversationTurns()
+    turns.waiting += 1
+    try:
+        async with turns.lock:
+            yield turns
+    finally:
+        turns.waiting -= 1
+        if turns.waiting == 0:
+            del _conversation_turns[conversation_key]
+
 @AGENT_APP.activity(ActivityTypes.invoke)
 async def invoke(context: TurnContext, state: TurnState) -> str:
     """
@@ -117,38 +192,218 @@ async def on_error(context: TurnContext, error: Exception):
 @AGENT_APP.message(re.compile(r".*", re.IGNORECASE), auth_handlers=["GRAPH"])
 async def on_message(context: TurnContext, state: TurnState):
     """
-    Main message handler: obtains OBO tokens, calls into utilities to process message and
-    returns the results to the user.
+    Main message handler: admits the turn under the global and per-user concurrency limits, then
+    processes the message within the turn deadline. Turns that cannot be admitted get a short 'busy' reply.
+    """
+    async def on_queued() -> None:
+        if STREAMING_RESPONSES:
+            context.streaming_response.queue_informative_update(QUEUED_MESSAGE)
+        else:
+            await context.send_activity(QUEUED_MESSAGE)
+
+    conversation_key = _conversation_key(context)
+    cancelled = asyncio.Event()
+
+    # Everything the turn does, including time spent queued, shares one deadline
+    with telemetry.turn(streaming=STREAMING_RESPONSES), resilience.deadline(resilience.TURN_DEADLINE_SECONDS):
+        try:
+            async with admission.admit(_user_key(context), on_queued):
+                # Supersede the previous turn only once this one is admitted: a rejected turn must not
+                # cancel an answer the user would then never get
+                previous = _pending_turns.get(conversation_key)
+                if previous is not None:
+                    previous.set()
+                _pending_turns[conversation_key] = cancelled
+                await _handle_message(context, state, conversation_key, cancelled)
+        except AdmissionRejected:
+            await _reply(context, BUSY_MESSAGE)
+        finally:
+            if _pending_turns.get(conversation_key) is cancelled:
+                del _pending_turns[conversation_key]
+
+
+def _user_key(context: TurnContext) -> str:
+    """
+    Identify the requesting user for per-user limits.
+    """
+    user = context.activity.from_property
+    if user is None:
+        return ""
+    return user.aad_object_id or user.id or ""
+
+
+def _conversation_key(context: TurnContext) -> tuple[str, str]:
+    """
+    Key for superseding and serializing turns: the conversation and the requesting user, since in a
+    group chat or channel each member's questions are independent of the others'.
+    """
+    conversation_id = context.activity.conversation.id if context.activity.conversation else ""
+    return conversation_id, _user_key(context)
+
+
+def _session_property(context: TurnContext) -> str:
+    """
+    Conversation state property of the requesting user's session. In a group chat or channel each
+    member has their own, so no one continues another member's thread (and the Genie results in it)
+    or posts into their Genie conversation with their own token.
+    """
+    return f"{GENIE_SESSION_STATE}:{_user_key(context)}"
+
+
+async def _handle_message(context: TurnContext, state: TurnState, conversation_key: tuple[str, str], cancelled: asyncio.Event):
+    """
+    Obtains OBO tokens, calls into utilities to process message and returns the results to the user.
+    A turn superseded by a newer message of the same user in the conversation replies with a short
+    note instead, and the newer turn runs the agent once the superseded one has finished.
     """
     try:
         prompt = context.activity.text.strip()
-        await context.send_activity("Agent is thinking...Thanks for being patient...")
+        if STREAMING_RESPONSES:
+            context.streaming_response.queue_informative_update(THINKING_MESSAGE)
+        else:
+            await context.send_activity(THINKING_MESSAGE)
 
-        # Always fetch a fresh ADB token for the requesting user
-        user_access_token = await AGENT_APP.auth.get_token(context, "GRAPH")
-        await utils.get_adb_token(user_access_token.token)
+        # ADB token for the requesting user (served from the per-user OBO cache when still valid)
+        with telemetry.phase("obo.get_adb_token"):
+            user_access_token = await AGENT_APP.auth.get_token(context, "GRAPH")
+            adbtoken = await utils.get_adb_token(user_access_token.token)
 
     except Exception as e:
-        await context.send_activity(MessageFactory.text("Error occurred while fetching ADB token. error: " + str(e)))
+        await _reply(context, "Error occurred while fetching ADB token. error: " + str(e))
         return
 
     try:
         # Validate Foundry connection
-        if agent.genie_workspaceid is None or utils.adbtoken is None:
+        if agent.genie_workspaceid is None or adbtoken is None:
             if agent.invalid_foundry_connection:
-                await context.send_activity(MessageFactory.text("Azure Foundry URL is either incorrect or the Databricks Genie connection isn't configured for the Azure AI Foundry project."))
+                await _reply(context, "Azure Foundry URL is either incorrect or the Databricks Genie connection isn't configured for the Azure AI Foundry project.")
                 return
 
-        response, imageurl = await agent.process_message(prompt)
+        async with _conversation_turn(conversation_key) as turns:
+            session = turns.session or agent.ConversationSession.from_dict(state.conversation.get_value(_session_property(context)))
+
+            if cancelled.is_set():
+                # Superseded while waiting for the turn before; the newer turn answers instead
+                await _reply(context, SUPERSEDED_MESSAGE)
+            elif STREAMING_RESPONSES:
+                await _stream_response(context, prompt, adbtoken, session, cancelled)
+            else:
+                response, imageurls = await agent.process_message(prompt, adbtoken, session, cancelled=cancelled)
+                if cancelled.is_set():
+                    response, imageurls = SUPERSEDED_MESSAGE, []
+
+                with telemetry.phase("teams.send"):
+                    if response:
+                        await context.send_activity(MessageFactory.text(response))
+
+                    for imageurl in imageurls:
+                        await _send_custom_card(context, imageurl)
 
-        if response:
-            await context.send_activity(MessageFactory.text(response))
+            turns.session = session
 
-        if imageurl:
-            await _send_custom_card(context, imageurl)
+        await _save_session(context, state, session)
 
     except Exception as e:
-        await context.send_activity(MessageFactory.text(traceback.format_exc()))
+        await _reply(context, traceback.format_exc())
+
+
+async def _save_session(context: TurnContext, state: TurnState, session: "agent.ConversationSession"):
+    """
+    Save the user's session now rather than with the rest of the turn state. The conversation state
+    was loaded when the turn started, possibly before an overlapping turn (another member's, or this
+    user's previous one) saved its own, so it is read again and the session written on top of it;
+    on an eTag conflict (another save in between) that is repeated.
+    """
+    property_name = _session_property(context)
+    for attempt in range(1, SESSION_SAVE_ATTEMPTS + 1):
+        await state.conversation.load(context, force=True)
+        state.conversation.set_value(property_name, session.to_dict())
+        try:
+            await state.conversation.save(context)
+            return
+        except StorageConflictError:
+            if attempt == SESSION_SAVE_ATTEMPTS:
+                raise
+            logger.info("Conversation state changed while saving the session; saving it again on top of the newer state")
+
+
+async def _stream_response(
+    context: TurnContext,
+    prompt: str,
+    adbtoken: str,
+    session: "agent.ConversationSession",
+    cancelled: asyncio.Event,
+):
+    """
+    Run the agent in streaming mode: tool status goes out as informative updates, response text as
+    streamed chunks, and chart cards are attached to the final message.
+    """
+    streaming = context.streaming_response
+    last_status = None
+    streamed = ""
+
+    async def on_progress(kind: str, text: str) -> None:
+        nonlocal last_status, streamed
+        if cancelled.is_set():
+            return
+        if kind == "status":
+            # Informative updates are only allowed before the first text chunk. Teams paces queued
+            # updates about a second apart, so repeats (parallel Genie questions) are dropped.
+            if not streaming.get_message() and text != last_status:
+                last_status = text
+                streaming.queue_informative_update(text)
+        elif kind == "text":
+            streamed += text
+            streaming.queue_text_chunk(text)
+
+    response, imageurls = await agent.process_message(prompt, adbtoken, session, on_progress, cancelled)
+    if cancelled.is_set():
+        response, imageurls = SUPERSEDED_MESSAGE, []
+
+    # A response other than the streamed answer (an error, possibly after partial text, or the
+    # superseded note) still has to reach the user: sent on its own, or after what was streamed
+    if response and response != streamed:
+        streaming.queue_text_chunk("\n\n" + response if streaming.get_message() else response)
+
+    with telemetry.phase("teams.send"):
+        if imageurls:
+            streaming.set_attachments([await _chart_card(imageurl) for imageurl in imageurls])
+
+        await streaming.end_stream()
+
+
+async def _reply(context: TurnContext, text: str):
+    """
+    Send a text reply, finishing the streamed response when streaming is enabled.
+    """
+    if STREAMING_RESPONSES:
+        try:
+            context.streaming_response.queue_text_chunk(text)
+            await context.streaming_response.end_stream()
+            return
+        except RuntimeError:
+            # The stream already ended; fall back to a separate message
+            pass
+
+    await context.send_activity(MessageFactory.text(text))
+
+
+async def _chart_card(imageurl: str) -> Attachment:
+    """
+    Build an adaptive card showing the visualization image from blob storage.
+    """
+    container_blob_file_path = await utils.get_blob_url(imageurl, STORAGE_ACCTNAME, STORAGE_CONTNAME)
+
+    card_data = {
+        "type": "AdaptiveCard",
+        "$schema": "https://adaptivecards.io/schemas/adaptive-card.json",
+        "version": "1.5",
+        "body": [
+            {"type": "Image", "id": "0001", "url": container_blob_file_path}
+        ],
+    }
+
+    return Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card_data)
 
 
 async def _send_custom_card(turn_context: TurnContext, imageurl: str):
@@ -156,22 +411,99 @@ async def _send_custom_card(turn_context: TurnContext, imageurl: str):
     Send an adaptive card with the visualization image URL from blob storage.
     """
     try:
-        container_blob_file_path = f"https://{STORAGE_ACCTNAME}.blob.core.windows.net/{STORAGE_CONTNAME}/{imageurl}"
+        await turn_context.send_activity(MessageFactory.attachment(await _chart_card(imageurl)))
 
-        card_data = {
-            "type": "AdaptiveCard",
-            "$schema": "https://adaptivecards.io/schemas/adaptive-card.json",
-            "version": "1.5",
-            "body": [
-                {"type": "Image", "id": "0001", "url": container_blob_file_path}
-            ],
-        }
+    except Exception as e:
+        await turn_context.send_activity(f"Error sending custom adaptive card: {str(e)}")
 
-        attachment = Attachment(content_type="application/vnd.microsoft.card.adaptive", content=card_data)
-        await turn_context.send_activity(MessageFactory.attachment(attachment))
 
+async def _warm_up_step(name: str, step: Callable[[], Awaitable[None]]) -> None:
+    _warmup_status[name] = "pending"
+    try:
+        await asyncio.wait_for(step(), WARMUP_TIMEOUT_SECONDS)
+        _warmup_status[name] = "ok"
     except Exception as e:
-        await turn_context.send_activity(f"Error sending custom adaptive card: {str(e)}")
+        logger.warning(f"Warm-up step {name} failed: {e!r}")
+        _warmup_status[name] = f"failed: {e!r}"
 
 
-__all__ = ["invoke", "handle_sign_in_success", "on_members_added", "on_error", "on_message"]
+async def warm_up() -> None:
+    """
+    Pre-create what the first turns would otherwise wait for: the Databricks SDK import, the Foundry
+    agent client and its connection, pooled connections to Entra ID and blob storage, and the
+    local chart workers.
+    """
+    global _warmup_done
+
+    steps: dict[str, Callable[[], Awaitable[None]]] = {}
+    if agent.charts.LOCAL_CHARTS:
+        # First, so the workers' matplotlib import overlaps the other steps
+        steps["chart_renderer"] = agent.charts.preload
+    steps.update({
+        "databricks_sdk": lambda: asyncio.to_thread(agent.tools.preload),
+        "foundry_agent": agent.warm_up,
+        "entra_id": utils.warm_up_http,
+    })
+    if STORAGE_ACCTNAME:
+        steps["blob_storage"] = lambda: utils.warm_up_blob(STORAGE_ACCTNAME)
+
+    started = time.perf_counter()
+    with telemetry.phase("warm_up"):
+        await asyncio.gather(*[_warm_up_step(name, step) for name, step in steps.items()])
+    _warmup_done = True
+    logger.info(f"Warm-up finished in {time.perf_counter() - started:.1f}s: {_warmup_status}")
+
+
+def readiness() -> dict:
+    """
+    Warm-up progress for the /ready endpoint.
+    """
+    return {"ready": _warmup_done, "steps": dict(_warmup_status)}
+
+
+async def start_background_tasks() -> None:
+    """
+    Set up tracing, then start the warm-up and the chart blob sweeper on server startup.
+    """
+    if setup_agent_tracing is not None and setup_agent_tracing():
+        logger.info("Starting M365 agent with tracing enabled")
+    else:
+        logger.info("Starting M365 agent without tracing")
+
+    if WARMUP_ENABLED:
+        _background_tasks.append(asyncio.create_task(warm_up()))
+
+    if STORAGE_ACCTNAME and STORAGE_CONTNAME and CHART_RETENTION_HOURS > 0:
+        _background_tasks.append(asyncio.create_task(utils.run_blob_sweeper(
+            STORAGE_ACCTNAME,
+            STORAGE_CONTNAME,
+            max_age=timedelta(hours=CHART_RETENTION_HOURS),
+            interval=timedelta(minutes=CHART_SWEEP_INTERVAL_MINUTES),
+        )))
+
+
+async def close_resources() -> None:
+    """
+    Stop background tasks and release pooled HTTP sessions and worker threads on shutdown.
+    """
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
+
+    await agent.close_agent()
+    close_storage = getattr(STORAGE, "close", None)
+    if close_storage is not None:
+        await close_storage()
+    await utils.close_http_session()
+    await utils.close_blob_clients()
+    agent.tools.close_clients()
+    agent.tools.shutdown_executor()
+    agent.charts.shutdown_pool()
+
+    # Flush buffered spans and metrics
+    if shutdown_tracing is not None:
+        shutdown_tracing()
+
+
+__all__ = ["close_resources", "readiness", "start_background_tasks", "warm_up", "invoke", "handle_sign_in_success", "on_members_added", "on_error", "on_message"]
@@ -1,27 +1,62 @@
 import os
-from microsoft_agents.hosting.core import AgentApplication, AgentAuthConfiguration
-from microsoft_agents.hosting.aiohttp import (
-    start_agent_process,
-    jwt_authorization_middleware,
-    CloudAdapter,
-)
-from aiohttp.web import Request, Response, Application, run_app
-
-# Attempt package-relative imports when run as a package; fall back to top-level imports
-try:
-    # Import handlers to register them with AGENT_APP (module import triggers decorator registration)
-    from . import app  # noqa: F401
-except Exception:
-    # When executed as a script (python src/main.py) the src/ directory is on sys.path
-    import app  # noqa: F401
-
-def start_server(agent_application: AgentApplication, auth_configuration: AgentAuthConfiguration):
+import hmac
+from typing import TYPE_CHECKING
+from aiohttp.web import Request, Response, Application, json_response, middleware, run_app
+
+# The agent application and the SDK are imported when the server is built, not with this module:
+# local chart worker processes import it as __mp_main__ and need none of them
+if TYPE_CHECKING:
+    from microsoft_agents.hosting.core import AgentApplication, AgentAuthConfiguration
+
+
+def _import_app():
+    # Attempt package-relative imports when run as a package; fall back to top-level imports
+    try:
+        # Import handlers to register them with AGENT_APP (module import triggers decorator registration)
+        from . import app
+    except Exception:
+        # When executed as a script (python src/main.py) the src/ directory is on sys.path
+        import app
+    return app
+
+
+# Operational endpoints called by probes and operators, not by the Bot Framework: no bot JWT is required
+UNAUTHENTICATED_PATHS = {
+    "/health",
+    "/ready",
+    "/metrics/admission",
+    "/metrics/circuits",
+    # Guarded by X-Admin-Key instead
+    "/admin/genie-cache/invalidate",
+}
+
+
+def create_app(agent_application: "AgentApplication", auth_configuration: "AgentAuthConfiguration") -> Application:
+    """
+    Build the aiohttp application serving the agent and its operational endpoints.
+    """
+    # app.py loads .env, so it comes before the modules that read settings on import
+    app = _import_app()
+    from microsoft_agents.hosting.aiohttp import start_agent_process, jwt_authorization_middleware, CloudAdapter
+    import agents.genie_cache as genie_cache
+    from admission import admission
+    import resilience
+
+    @middleware
+    async def authorization_middleware(request: Request, handler):
+        """
+        Validate the Bot Framework JWT on every route except UNAUTHENTICATED_PATHS.
+        """
+        if request.path in UNAUTHENTICATED_PATHS:
+            return await handler(request)
+        return await jwt_authorization_middleware(request, handler)
+
     async def entry_point(req: Request) -> Response:
         agent: AgentApplication = req.app["agent_app"]
         adapter: CloudAdapter = req.app["adapter"]
         return await start_agent_process(req, agent, adapter)
 
-    APP = Application(middlewares=[jwt_authorization_middleware])
+    APP = Application(middlewares=[authorization_middleware])
     APP.router.add_post("/api/messages", entry_point)
 
     # Add /health GET endpoint
@@ -30,9 +65,57 @@ def start_server(agent_application: AgentApplication, auth_configuration: AgentA
 
     APP.router.add_get("/health", health_check)
 
+    # Readiness: 503 until the background warm-up has finished, then 200 with the result of each step
+    async def ready_check(req: Request) -> Response:
+        status = app.readiness()
+        return json_response(status, status=200 if status["ready"] else 503)
+
+    APP.router.add_get("/ready", ready_check)
+
+    # Admission control metrics: in-flight turns, queue depth and rejections
+    async def admission_metrics(req: Request) -> Response:
+        return json_response(admission.metrics())
+
+    APP.router.add_get("/metrics/admission", admission_metrics)
+
+    # Circuit breaker state per dependency (closed / open / half_open)
+    async def circuit_metrics(req: Request) -> Response:
+        return json_response(resilience.breaker_states())
+
+    APP.router.add_get("/metrics/circuits", circuit_metrics)
+
+    # Admin hook to drop cached Genie results, e.g. after a data refresh. Only enabled when a key is configured.
+    # The cache is in process memory, so a call only clears the replica that serves it; with several
+    # replicas call each one (or wait for GENIE_CACHE_TTL_SECONDS).
+    admin_key = os.getenv("GENIE_CACHE_ADMIN_KEY", "")
+    if admin_key:
+        async def invalidate_genie_cache(req: Request) -> Response:
+            # Compare bytes: compare_digest rejects non-ASCII str, which would turn a bad key into a 500
+            if not hmac.compare_digest(req.headers.get("X-Admin-Key", "").encode(), admin_key.encode()):
+                return Response(status=403, text="Forbidden")
+            removed = genie_cache.invalidate(req.query.get("space_id"))
+            return json_response({"removed": removed})
+
+        APP.router.add_post("/admin/genie-cache/invalidate", invalidate_genie_cache)
+
+    # Start background tasks with the server and close pooled clients when it shuts down
+    async def on_startup(_: Application) -> None:
+        await app.start_background_tasks()
+
+    async def on_cleanup(_: Application) -> None:
+        await app.close_resources()
+
+    APP.on_startup.append(on_startup)
+    APP.on_cleanup.append(on_cleanup)
+
     APP["agent_configuration"] = auth_configuration
     APP["agent_app"] = agent_application
     APP["adapter"] = agent_application.adapter
+    return APP
+
+
+def start_server(agent_application: "AgentApplication", auth_configuration: "AgentAuthConfiguration"):
+    APP = create_app(agent_application, auth_configuration)
 
     try:
         run_app(APP, host="0.0.0.0", port=int(os.getenv("PORT", "3978")))
@@ -41,6 +124,7 @@ def start_server(agent_application: AgentApplication, auth_configuration: AgentA
 
 # Start the server using the configured AgentApplication and the default auth configuration
 if __name__ == "__main__":
+    app = _import_app()
     start_server(
         agent_application=app.AGENT_APP,
         auth_configuration=app.CONNECTION_MANAGER.get_default_connection_configuration(),
@@ -0,0 +1,343 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Iterator, Optional
+
+import aiohttp
+import requests
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+logger = logging.getLogger("microsoft_agents")
+
+# Retries with jittered exponential backoff, per-dependency circuit breakers and a per-turn deadline
+# shared by the OBO, Genie and Foundry calls of a turn.
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.5"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "10"))
+
+# Consecutive transient failures that open a breaker, and how long it stays open before a trial call
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+# Time budget of a whole turn; retries and waits never run past it
+TURN_DEADLINE_SECONDS = float(os.getenv("TURN_DEADLINE_SECONDS", "120"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# Monotonic time by which the current turn must finish, or None when unbounded
+current_deadline: ContextVar[Optional[float]] = ContextVar("current_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """
+    Raised when the turn's time budget runs out before a call could complete.
+    """
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling the dependency while its circuit breaker is open.
+    """
+
+    def __init__(self, dependency: str, retry_in: float):
+        super().__init__(f"{dependency} is temporarily unavailable; retry in {retry_in:.0f}s")
+        self.dependency = dependency
+        self.retry_in = retry_in
+
+
+@contextmanager
+def deadline(seconds: float = TURN_DEADLINE_SECONDS) -> Iterator[None]:
+    """
+    Bound everything run inside the block (in this context) by a deadline `seconds` from now.
+    An enclosing, earlier deadline is kept.
+    """
+    new_deadline = time.monotonic() + seconds
+    outer = current_deadline.get()
+    token = current_deadline.set(new_deadline if outer is None else min(outer, new_deadline))
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def remaining_time() -> Optional[float]:
+    """
+    Seconds left before the current deadline, or None when there is none.
+    """
+    end = current_deadline.get()
+    if end is None:
+        return None
+    return max(end - time.monotonic(), 0.0)
+
+
+class CircuitBreaker:
+    """
+    Opens after a run of consecutive transient failures so callers fail fast, then lets a single
+    trial call through once the reset timeout passes (half-open) and closes again on success.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_seconds: float = CIRCUIT_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> None:
+        state = self.state
+        if state == "closed":
+            return
+        if state == "half_open" and not self._trial_in_flight:
+            self._trial_in_flight = True
+            return
+        raise CircuitOpenError(self.name, max(self.reset_seconds - (time.monotonic() - self._opened_at), 0.0))
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info(f"Circuit for {self.name} closed")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._trial_in_flight or self._failures >= self.failure_threshold:
+            if self._opened_at is None or self._trial_in_flight:
+                logger.warning(f"Circuit for {self.name} opened after {self._failures} failures")
+            self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+
+    def release(self) -> None:
+        # A call that ended without a verdict (e.g. a non-transient error) frees the trial slot
+        self._trial_in_flight = False
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(dependency: str) -> CircuitBreaker:
+    breaker = _breakers.get(dependency)
+    if breaker is None:
+        breaker = _breakers[dependency] = CircuitBreaker(dependency)
+    return breaker
+
+
+def breaker_states() -> dict[str, str]:
+    return {name: breaker.state for name, breaker in _breakers.items()}
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def _databricks_errors():
+    # The Databricks SDK is imported on first use (see genie_tools); until then none of its errors can occur
+    return sys.modules.get("databricks.sdk.errors")
+
+
+def retry_after(error: BaseException) -> Optional[float]:
+    """
+    Server-requested delay carried by an error (Retry-After header), if any.
+    """
+    databricks_errors = _databricks_errors()
+    if databricks_errors is not None and isinstance(error, databricks_errors.DatabricksError) and error.retry_after_secs:
+        return float(error.retry_after_secs)
+    if isinstance(error, aiohttp.ClientResponseError) and error.headers:
+        return _parse_retry_after(error.headers.get("Retry-After"))
+    if isinstance(error, HttpResponseError) and error.response is not None:
+        return _parse_retry_after(error.response.headers.get("Retry-After"))
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return _parse_retry_after(error.response.headers.get("Retry-After"))
+    return None
+
+
+def is_transient(error: BaseException) -> bool:
+    """
+    Whether an error is worth retrying: throttling, 5xx responses, timeouts and connection failures.
+    """
+    if isinstance(error, (DeadlineExceeded, CircuitOpenError)):
+        return False
+    databricks_errors = _databricks_errors()
+    if databricks_errors is not None and isinstance(error, (
+        databricks_errors.TooManyRequests,
+        databricks_errors.TemporarilyUnavailable,
+        databricks_errors.InternalError,
+        databricks_errors.DeadlineExceeded,
+    )):
+        return True
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRYABLE_STATUS_CODES
+    if isinstance(error, (aiohttp.ClientConnectionError, ServiceRequestError, ServiceResponseError)):
+        return True
+    if isinstance(error, HttpResponseError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code in RETRYABLE_STATUS_CODES
+    if isinstance(error, (requests.ConnectionError, requests.Timeout, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    return False
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY_SECONDS, cap: float = RETRY_MAX_DELAY_SECONDS) -> float:
+    """
+    Full-jitter exponential backoff for the given attempt (1-based).
+    """
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+
+async def call_with_retry(
+    func: Callable[..., Awaitable[Any]],
+    *args,
+    dependency: str,
+    max_attempts: int = RETRY_MAX_ATTEMPTS,
+    retryable: Callable[[BaseException], bool] = is_transient,
+    **kwargs,
+) -> Any:
+    """
+    Await func(*args, **kwargs) behind the dependency's circuit breaker, retrying transient failures
+    with jittered exponential backoff (or the server's Retry-After). Each attempt and every wait is
+    bounded by the current deadline.
+    """
+    breaker = get_breaker(dependency)
+    attempt = 0
+
+    while True:
+        attempt += 1
+        breaker.before_call()
+
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            breaker.release()
+            raise DeadlineExceeded(f"No time left to call {dependency}")
+
+        try:
+            if remaining is None:
+                result = await func(*args, **kwargs)
+            else:
+                result = await asyncio.wait_for(func(*args, **kwargs), remaining)
+        except asyncio.TimeoutError as e:
+            if remaining is not None and remaining_time() <= 0:
+                breaker.release()
+                raise DeadlineExceeded(f"Ran out of time calling {dependency}") from e
+            delay = _retry_delay(breaker, dependency, e, attempt, max_attempts, retryable)
+        except Exception as e:
+            delay = _retry_delay(breaker, dependency, e, attempt, max_attempts, retryable)
+        except BaseException:
+            # Cancelled (turn deadline, superseded turn): no verdict, but the trial slot must be freed
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+        await asyncio.sleep(delay)
+
+
+def call_with_retry_sync(
+    func: Callable[..., Any],
+    *args,
+    dependency: str,
+    max_attempts: int = RETRY_MAX_ATTEMPTS,
+    retryable: Callable[[BaseException], bool] = is_transient,
+    **kwargs,
+) -> Any:
+    """
+    Blocking form of call_with_retry for calls made from a worker thread, such as the chunk fetches
+    of a statement result. No attempt starts after the current deadline, but a running attempt is
+    not interrupted by it.
+    """
+    breaker = get_breaker(dependency)
+    attempt = 0
+
+    while True:
+        attempt += 1
+        breaker.before_call()
+
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            breaker.release()
+            raise DeadlineExceeded(f"No time left to call {dependency}")
+
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            delay = _retry_delay(breaker, dependency, e, attempt, max_attempts, retryable)
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return result
+
+        time.sleep(delay)
+
+
+def _retry_delay(
+    breaker: CircuitBreaker,
+    dependency: str,
+    error: Exception,
+    attempt: int,
+    max_attempts: int,
+    retryable: Callable[[BaseException], bool],
+) -> float:
+    """
+    Record a failed attempt and return the wait before the next one; raises the error when the call
+    should not be retried.
+    """
+    if not is_transient(error):
+        breaker.release()
+        raise error
+
+    breaker.record_failure()
+    if attempt >= max_attempts or not retryable(error):
+        raise error
+
+    delay = retry_after(error)
+    if delay is None:
+        delay = backoff_delay(attempt)
+    remaining = remaining_time()
+    if remaining is not None and delay >= remaining:
+        logger.warning(f"Not retrying {dependency}: retry delay {delay:.1f}s exceeds the remaining {remaining:.1f}s")
+        raise error
+
+    logger.warning(f"Transient failure calling {dependency} (attempt {attempt}/{max_attempts}), retrying in {delay:.1f}s: {error}")
+    return delay
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "DeadlineExceeded",
+    "breaker_states",
+    "call_with_retry",
+    "call_with_retry_sync",
+    "current_deadline",
+    "deadline",
+    "get_breaker",
+    "is_transient",
+    "remaining_time",
+    "retry_after",
+]
@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional, Type
+
+from microsoft_agents.hosting.core import MemoryStorage, Storage, StoreItem
+
+logger = logging.getLogger("microsoft_agents")
+
+# Where turn state and OAuth sign-in state live. "memory" keeps them in the process (one replica
+# only); "sqlite" shares them between the workers of one host through a file; "redis" shares them
+# between replicas.
+STATE_STORAGE = os.getenv("STATE_STORAGE", "memory").lower()
+STATE_STORAGE_PATH = os.getenv("STATE_STORAGE_PATH", "state.db")
+STATE_STORAGE_REDIS_URL = os.getenv("STATE_STORAGE_REDIS_URL", "redis://localhost:6379/0")
+STATE_STORAGE_KEY_PREFIX = os.getenv("STATE_STORAGE_KEY_PREFIX", "m365-data-agents:")
+# Items not written for this long expire (0 keeps them forever)
+STATE_TTL_SECONDS = int(os.getenv("STATE_TTL_SECONDS", "86400"))
+
+# Property carrying an item's version, as in Bot Framework storage: writes of an item read with
+# one eTag fail once someone else has written it; "*" (or no eTag) overwrites unconditionally.
+ETAG = "eTag"
+
+
+class StorageConflictError(Exception):
+    """
+    Raised when a write carries an eTag that no longer matches the stored item.
+    """
+
+    def __init__(self, keys: list[str]):
+        super().__init__(f"Storage items were changed by another writer: {', '.join(keys)}")
+        self.keys = keys
+
+
+class SharedStorage(Storage, ABC):
+    """
+    Storage protocol implementation on top of a JSON key-value store. Handles validation,
+    (de)serialization and eTags; subclasses provide batched reads, conditional writes and deletes,
+    and connect on first use rather than when created.
+    """
+
+    def __init__(self, ttl_seconds: int = STATE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+
+    async def read(self, keys: list[str], *, target_cls: Type[StoreItem] = None, **kwargs) -> dict[str, StoreItem]:
+        if not keys:
+            raise ValueError("Storage.read(): Keys are required when reading.")
+        if not target_cls:
+            raise ValueError("Storage.read(): target_cls cannot be None.")
+        _check_keys(keys)
+
+        result: dict[str, StoreItem] = {}
+        for key, (data, etag) in (await self._read(keys)).items():
+            if isinstance(data, dict):
+                data[ETAG] = etag
+            result[key] = target_cls.from_json_to_store_item(data)
+        return result
+
+    async def write(self, changes: dict[str, StoreItem]) -> None:
+        if not changes:
+            raise ValueError("Storage.write(): Changes are required when writing.")
+        _check_keys(changes)
+
+        items: dict[str, tuple[str, Optional[str]]] = {}
+        for key, item in changes.items():
+            data = item.store_item_to_json()
+            expected = None
+            if isinstance(data, dict) and ETAG in data:
+                data = dict(data)
+                etag = data.pop(ETAG)
+                expected = None if etag in (None, "*") else etag
+            items[key] = (json.dumps(data, separators=(",", ":")), expected)
+
+        conflicts = await self._write(items)
+        if conflicts:
+            raise StorageConflictError(conflicts)
+
+    async def delete(self, keys: list[str]) -> None:
+        if not keys:
+            raise ValueError("Storage.delete(): Keys are required when deleting.")
+        _check_keys(keys)
+        await self._delete(list(keys))
+
+    async def close(self) -> None:
+        pass
+
+    @abstractmethod
+    async def _read(self, keys: list[str]) -> dict[str, tuple[object, str]]:
+        """
+        Stored JSON and eTag of each key that exists and has not expired.
+        """
+
+    @abstractmethod
+    async def _write(self, items: dict[str, tuple[str, Optional[str]]]) -> list[str]:
+        """
+        Store each key's JSON text under a new eTag, as one atomic batch. Items with an expected eTag
+        are only written when it matches; on any mismatch nothing is written and the conflicting
+        keys are returned.
+        """
+
+    @abstractmethod
+    async def _delete(self, keys: list[str]) -> None:
+        """
+        Remove the keys; missing ones are ignored.
+        """
+
+
+def _check_keys(keys) -> None:
+    if any(key == "" for key in keys):
+        raise ValueError("Storage keys cannot be empty")
+
+
+def _new_etag() -> str:
+    return uuid.uuid4().hex
+
+
+class SqliteStorage(SharedStorage):
+    """
+    Storage in a SQLite file, for local testing and for several workers on one host. Calls run on a
+    worker thread over a single connection, opened by the first call.
+    """
+
+    def __init__(self, path: str = STATE_STORAGE_PATH, ttl_seconds: int = STATE_TTL_SECONDS):
+        super().__init__(ttl_seconds)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # Called with self._lock held
+        if self._connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, data TEXT NOT NULL, etag TEXT NOT NULL, expires_at REAL)"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _expires_at(self) -> Optional[float]:
+        return time.time() + self.ttl_seconds if self.ttl_seconds > 0 else None
+
+    def _read_sync(self, keys: list[str]) -> dict[str, tuple[object, str]]:
+        placeholders = ",".join("?" * len(keys))
+        with self._lock:
+            rows = self._connect().execute(
+                f"SELECT key, data, etag FROM state WHERE key IN ({placeholders}) AND (expires_at IS NULL OR expires_at > ?)",
+                [*keys, time.time()],
+            ).fetchall()
+        return {key: (json.loads(data), etag) for key, data, etag in rows}
+
+    def _write_sync(self, items: dict[str, tuple[str, Optional[str]]]) -> list[str]:
+        now = time.time()
+        expires_at = self._expires_at()
+        with self._lock:
+            cursor = self._connect().cursor()
+            # BEGIN IMMEDIATE takes the write lock up front so the eTag checks and writes are atomic
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                conflicts = []
+                for key, (_, expected) in items.items():
+                    if expected is None:
+                        continue
+                    row = cursor.execute(
+                        "SELECT etag FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)", (key, now)
+                    ).fetchone()
+                    if row is None or row[0] != expected:
+                        conflicts.append(key)
+                if conflicts:
+                    cursor.execute("ROLLBACK")
+                    return conflicts
+
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO state (key, data, etag, expires_at) VALUES (?, ?, ?, ?)",
+                    [(key, data, _new_etag(), expires_at) for key, (data, _) in items.items()],
+                )
+                cursor.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+                cursor.execute("COMMIT")
+                return []
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+
+    def _delete_sync(self, keys: list[str]) -> None:
+        with self._lock:
+            self._connect().executemany("DELETE FROM state WHERE key = ?", [(key,) for key in keys])
+
+    async def _read(self, keys: list[str]) -> dict[str, tuple[object, str]]:
+        return await asyncio.to_thread(self._read_sync, keys)
+
+    async def _write(self, items: dict[str, tuple[str, Optional[str]]]) -> list[str]:
+        return await asyncio.to_thread(self._write_sync, items)
+
+    async def _delete(self, keys: list[str]) -> None:
+        await asyncio.to_thread(self._delete_sync, keys)
+
+    async def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+# Checks every expected eTag, then writes all items with their new eTags and TTL, atomically.
+# KEYS: item keys; ARGV: ttl in ms (0 for none), then per key: expected eTag ("" for none), new eTag, data
+_REDIS_WRITE_SCRIPT = """
+local ttl = tonumber(ARGV[1])
+local conflicts = {}
+for i, key in ipairs(KEYS) do
+    local expected = ARGV[2 + (i - 1) * 3]
+    if expected ~= "" and redis.call("HGET", key, "etag") ~= expected then
+        table.insert(conflicts, key)
+    end
+end
+if #conflicts > 0 then
+    return conflicts
+end
+for i, key in ipairs(KEYS) do
+    local base = 2 + (i - 1) * 3
+    redis.call("HSET", key, "etag", ARGV[base + 1], "data", ARGV[base + 2])
+    if ttl > 0 then
+        redis.call("PEXPIRE", key, ttl)
+    else
+        redis.call("PERSIST", key)
+    end
+end
+return conflicts
+"""
+
+
+class RedisStorage(SharedStorage):
+    """
+    Storage in Redis (or a Redis-compatible service such as Azure Cache for Redis) for running
+    several replicas. Each item is a hash of data and etag; TTL is Redis key expiry. Requires the
+    optional redis package. The client (and its connection pool) is created by the first call, on
+    the event loop that uses it.
+    """
+
+    def __init__(self, url: str = STATE_STORAGE_REDIS_URL, prefix: str = STATE_STORAGE_KEY_PREFIX, ttl_seconds: int = STATE_TTL_SECONDS):
+        super().__init__(ttl_seconds)
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("STATE_STORAGE=redis requires the redis package (pip install redis)") from e
+
+        self.url = url
+        self.prefix = prefix
+        self._redis = redis
+        self._client = None
+        self._write_script = None
+
+    def _connect(self):
+        if self._client is None:
+            self._client = self._redis.Redis.from_url(self.url, decode_responses=True)
+            self._write_script = self._client.register_script(_REDIS_WRITE_SCRIPT)
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def _read(self, keys: list[str]) -> dict[str, tuple[object, str]]:
+        # One round trip for the whole batch
+        async with self._connect().pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hmget(self._key(key), "data", "etag")
+            values = await pipe.execute()
+        return {
+            key: (json.loads(data), etag)
+            for key, (data, etag) in zip(keys, values)
+            if data is not None
+        }
+
+    async def _write(self, items: dict[str, tuple[str, Optional[str]]]) -> list[str]:
+        self._connect()
+        args: list = [self.ttl_seconds * 1000]
+        for data, expected in items.values():
+            args.extend([expected or "", _new_etag(), data])
+        conflicts = await self._write_script(keys=[self._key(key) for key in items], args=args)
+        return [key[len(self.prefix):] for key in conflicts]
+
+    async def _delete(self, keys: list[str]) -> None:
+        await self._connect().delete(*[self._key(key) for key in keys])
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def create_storage(kind: str = STATE_STORAGE) -> Storage:
+    """
+    Build the storage selected by STATE_STORAGE.
+    """
+    if kind == "memory":
+        return MemoryStorage()
+    if kind == "sqlite":
+        logger.info(f"Keeping state in SQLite at {STATE_STORAGE_PATH}")
+        return SqliteStorage()
+    if kind == "redis":
+        logger.info("Keeping state in Redis")
+        return RedisStorage()
+    raise ValueError(f"Unknown STATE_STORAGE '{kind}' (expected memory, sqlite or redis)")
+
+
+__all__ = [
+    "RedisStorage",
+    "SharedStorage",
+    "SqliteStorage",
+    "StorageConflictError",
+    "create_storage",
+]
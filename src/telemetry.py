@@ -0,0 +1,84 @@
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from opentelemetry import metrics, trace
+from opentelemetry.trace import Span
+
+logger = logging.getLogger("microsoft_agents")
+
+# Spans and latency histograms for the phases of a turn. Providers are installed by tracing_config;
+# until then (or when telemetry is disabled) these are no-ops.
+tracer = trace.get_tracer("m365_data_agents")
+meter = metrics.get_meter("m365_data_agents")
+
+phase_duration = meter.create_histogram(
+    "m365_data_agents.phase.duration",
+    unit="ms",
+    description="Duration of one phase of a turn (OBO exchange, Genie calls, formatting, uploads, Teams sends)",
+)
+turn_duration = meter.create_histogram(
+    "m365_data_agents.turn.duration",
+    unit="ms",
+    description="End-to-end duration of a message turn",
+)
+
+# Milliseconds spent per phase in the current turn. Phases nest (agent.run includes the Genie tool
+# calls it makes) and concurrent phases (parallel uploads) add up, so values are not exclusive.
+current_breakdown: ContextVar[Optional[dict[str, float]]] = ContextVar("current_breakdown", default=None)
+
+
+@contextmanager
+def phase(name: str, **attributes) -> Iterator[Span]:
+    """
+    Trace a phase as a span, record its duration in the phase histogram and add it to the turn's
+    latency breakdown.
+    """
+    started = time.perf_counter()
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        try:
+            yield span
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            phase_duration.record(elapsed_ms, {"phase": name})
+            breakdown = current_breakdown.get()
+            if breakdown is not None:
+                breakdown[name] = breakdown.get(name, 0.0) + elapsed_ms
+
+
+@contextmanager
+def turn(name: str = "turn", **attributes) -> Iterator[Span]:
+    """
+    Root span of a message turn. On exit the per-phase latency breakdown is attached to the span
+    and logged, and the turn duration is recorded.
+    """
+    breakdown: dict[str, float] = {}
+    token = current_breakdown.set(breakdown)
+    started = time.perf_counter()
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        try:
+            yield span
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            current_breakdown.reset(token)
+            turn_duration.record(elapsed_ms)
+            span.set_attributes({f"latency.{key}_ms": round(value, 1) for key, value in breakdown.items()})
+            summary = ", ".join(f"{key}={value:.0f}ms" for key, value in sorted(breakdown.items(), key=lambda item: -item[1]))
+            logger.info(f"Turn took {elapsed_ms:.0f}ms ({summary or 'no phases recorded'})")
+
+
+def latency_breakdown() -> dict[str, float]:
+    """
+    Copy of the current turn's latency breakdown so far.
+    """
+    return dict(current_breakdown.get() or {})
+
+
+__all__ = [
+    "latency_breakdown",
+    "phase",
+    "tracer",
+    "turn",
+]
@@ -1,34 +1,107 @@
 # OpenTelemetry tracing configuration for the Agent Framework SDK
 
 import os
+from typing import Optional
 from agent_framework import get_logger
+from agent_framework.observability import OBSERVABILITY_SETTINGS
+from opentelemetry import metrics, trace
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, InMemoryMetricReader, MetricReader, PeriodicExportingMetricReader
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter, SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
 
 # Initialize Agent Framework logger for tracing
 logger = get_logger("agent_framework.m365_data_agents.tracing")
 
-def setup_agent_tracing():
+# Where spans and metrics go: otlp (collector at OTEL_EXPORTER_OTLP_ENDPOINT), console, memory
+# (kept in-process for tests and benchmarks) or none. Exported over OTLP by default only when a
+# collector endpoint is configured; nothing listens on the localhost default in the deployed container.
+TELEMETRY_EXPORTER = os.getenv("TELEMETRY_EXPORTER", "otlp" if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") else "none").lower()
+METRIC_EXPORT_INTERVAL_MILLIS = int(os.getenv("METRIC_EXPORT_INTERVAL_MILLIS", "15000"))
+
+# Prompts, responses and tool arguments are only recorded on spans when explicitly enabled
+ENABLE_SENSITIVE_DATA = os.getenv("ENABLE_SENSITIVE_DATA", "false").lower() == "true"
+
+# Populated when TELEMETRY_EXPORTER=memory
+memory_span_exporter: Optional[InMemorySpanExporter] = None
+memory_metric_reader: Optional[InMemoryMetricReader] = None
+
+
+def _exporters(exporter: str) -> tuple[list, list[MetricReader]]:
+    global memory_span_exporter, memory_metric_reader
+
+    if exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+
+        return (
+            [BatchSpanProcessor(OTLPSpanExporter())],
+            [PeriodicExportingMetricReader(OTLPMetricExporter(), export_interval_millis=METRIC_EXPORT_INTERVAL_MILLIS)],
+        )
+    if exporter == "console":
+        return (
+            [BatchSpanProcessor(ConsoleSpanExporter())],
+            [PeriodicExportingMetricReader(ConsoleMetricExporter(), export_interval_millis=METRIC_EXPORT_INTERVAL_MILLIS)],
+        )
+    if exporter == "memory":
+        memory_span_exporter = InMemorySpanExporter()
+        memory_metric_reader = InMemoryMetricReader()
+        return [SimpleSpanProcessor(memory_span_exporter)], [memory_metric_reader]
+
+    raise ValueError(f"Unknown TELEMETRY_EXPORTER '{exporter}' (expected otlp, console, memory or none)")
+
+
+def setup_agent_tracing(exporter: str = TELEMETRY_EXPORTER) -> bool:
     """
-    Set up OpenTelemetry tracing for the Agent Framework SDK.
-    This integrates with AI Toolkit's tracing capabilities.
+    Install OpenTelemetry tracer and meter providers for the app's own spans and latency histograms
+    and enable the Agent Framework SDK's instrumentation on top of them.
     """
+    if exporter == "none":
+        logger.info("OpenTelemetry export disabled")
+        return False
+
     try:
         # Set up environment variables for OpenTelemetry
         os.environ.setdefault("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317")
         os.environ.setdefault("OTEL_EXPORTER_OTLP_PROTOCOL", "grpc")
         os.environ.setdefault("OTEL_SERVICE_NAME", "m365-data-agents")
         os.environ.setdefault("OTEL_RESOURCE_ATTRIBUTES", "service.name=m365-data-agents,service.version=1.0.0")
-        
-        # Enable sensitive data capture for development
-        os.environ.setdefault("AGENT_FRAMEWORK_ENABLE_SENSITIVE_DATA", "true")
-        
-        logger.info("OpenTelemetry tracing configured for Agent Framework SDK")
-        logger.info(f"OTLP Endpoint: {os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')}")
-        
+
+        span_processors, metric_readers = _exporters(exporter)
+        resource = Resource.create()
+
+        tracer_provider = TracerProvider(resource=resource)
+        for processor in span_processors:
+            tracer_provider.add_span_processor(processor)
+        trace.set_tracer_provider(tracer_provider)
+        metrics.set_meter_provider(MeterProvider(resource=resource, metric_readers=metric_readers))
+
+        # Agent Framework emits its gen_ai spans and metrics through the providers installed above
+        OBSERVABILITY_SETTINGS.enable_otel = True
+        OBSERVABILITY_SETTINGS.enable_sensitive_data = ENABLE_SENSITIVE_DATA
+
+        logger.info(f"OpenTelemetry configured with the {exporter} exporter (sensitive data: {ENABLE_SENSITIVE_DATA})")
+        if exporter == "otlp":
+            logger.info(f"OTLP Endpoint: {os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT')}")
+
         return True
     except Exception as e:
         logger.error(f"Failed to setup tracing: {e}")
         return False
 
+
+def shutdown_tracing() -> None:
+    """
+    Flush and shut down the installed providers so buffered spans and metrics are exported.
+    """
+    for provider in (trace.get_tracer_provider(), metrics.get_meter_provider()):
+        shutdown = getattr(provider, "shutdown", None)
+        if shutdown is not None:
+            shutdown()
+
+
 def get_trace_url():
     """
     Get the URL for viewing traces in AI Toolkit.
@@ -38,4 +111,4 @@ def get_trace_url():
 if __name__ == "__main__":
     setup_agent_tracing()
     print("✅ Tracing setup complete. Open AI Toolkit to view traces.")
-    print(f"📊 Trace viewer: {get_trace_url()}")
\ No newline at end of file
+    print(f"📊 Trace viewer: {get_trace_url()}")
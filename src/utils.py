@@ -1,47 +1,218 @@
 import os
+import time
+import json
+import base64
+import asyncio
+import hashlib
 import logging
 from os import path
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from dataclasses import dataclass
 from typing import Optional
-import requests
-from azure.identity import ClientSecretCredential, DefaultAzureCredential
-from azure.storage.blob import BlobServiceClient, ContentSettings
+import aiohttp
+from azure.identity.aio import DefaultAzureCredential as AsyncDefaultAzureCredential
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.storage.blob import BlobSasPermissions, ContentSettings, UserDelegationKey, generate_blob_sas
+from azure.storage.blob.aio import BlobServiceClient as AsyncBlobServiceClient
+import resilience
+import telemetry
 
 # Set up Agent Framework SDK logging and tracing
 logger = logging.getLogger("microsoft_agents")
 
-adbtoken: Optional[str] = None
+DATABRICKS_RESOURCE = "2ff814a6-3304-4ab8-85cb-cd0e6f879c1d"
+DATABRICKS_SCOPE = f"{DATABRICKS_RESOURCE}/.default"
+GRAPH_SCOPE = "https://graph.microsoft.com/.default"
 
-async def get_adb_token(passed_user_access_token: str) -> str:
+# Entra ID authority used for OBO exchanges (overridable for sovereign clouds and local test doubles)
+AAD_AUTHORITY_HOST = os.getenv("AAD_AUTHORITY_HOST", "https://login.microsoftonline.com").rstrip("/")
+
+# OBO token cache settings. Tokens are served until EXPIRY_SKEW seconds before they expire and
+# refreshed in the background once they enter the REFRESH_WINDOW.
+OBO_TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("OBO_TOKEN_CACHE_MAX_ENTRIES", "1000"))
+OBO_TOKEN_EXPIRY_SKEW_SECONDS = int(os.getenv("OBO_TOKEN_EXPIRY_SKEW_SECONDS", "60"))
+OBO_TOKEN_REFRESH_WINDOW_SECONDS = int(os.getenv("OBO_TOKEN_REFRESH_WINDOW_SECONDS", "300"))
+
+
+@dataclass
+class _CachedToken:
+    access_token: str
+    expires_at: float
+    assertion: str
+    refreshing: bool = False
+
+
+OBO_HTTP_TIMEOUT_SECONDS = float(os.getenv("OBO_HTTP_TIMEOUT_SECONDS", "30"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "100"))
+
+# Shared aiohttp session (and connection pool) for token endpoint calls
+_http_session: Optional[aiohttp.ClientSession] = None
+
+# Shared async blob clients (one per storage account) and the credential they use
+_blob_credential: Optional[AsyncDefaultAzureCredential] = None
+_blob_service_clients: dict[str, AsyncBlobServiceClient] = {}
+
+# Chart blobs: read-only SAS lifetime for card URLs (0 = plain blob URL) and the user delegation key
+# that signs them, cached per account. The service caps a key at 7 days and a SAS can't outlive its
+# key. By default a SAS lasts as long as the sweeper keeps an unused chart (CHART_RETENTION_HOURS),
+# so the image of a card in an older message stays visible until its blob is deleted; past the cap
+# (or with retention off) such images break after MAX_CHART_SAS_TTL_MINUTES.
+USER_DELEGATION_KEY_LIFETIME = timedelta(days=6, hours=23)
+MAX_CHART_SAS_TTL_MINUTES = 6 * 24 * 60
+_CHART_RETENTION_MINUTES = int(float(os.getenv("CHART_RETENTION_HOURS", "24")) * 60)
+CHART_SAS_TTL_MINUTES = min(
+    int(os.getenv("CHART_SAS_TTL_MINUTES", str(_CHART_RETENTION_MINUTES or MAX_CHART_SAS_TTL_MINUTES))),
+    MAX_CHART_SAS_TTL_MINUTES,
+)
+_user_delegation_keys: dict[str, tuple[UserDelegationKey, datetime]] = {}
+
+# (user key, scope) -> cached token, least recently used first
+_token_cache: "OrderedDict[tuple[str, str], _CachedToken]" = OrderedDict()
+_refresh_tasks: set[asyncio.Task] = set()
+
+
+def _jwt_claims(token: str) -> dict:
     """
-    Retrieve the Azure Databricks token via OBO using the Foundry project configuration.
-    Returns the ADB token string.
+    Decode the claims of a JWT without validating it. Only used on tokens we already trust
+    (the user assertion handed to us by the token service and tokens issued by AAD).
     """
-    # global project_client, adbtoken, invalid_foundry_connection
-    global adbtoken
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload))
+    except Exception:
+        return {}
+
+
+def _get_http_session() -> aiohttp.ClientSession:
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        _http_session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=OBO_HTTP_TIMEOUT_SECONDS),
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE),
+        )
+    return _http_session
+
+
+async def warm_up_http() -> None:
+    """
+    Open a pooled connection to the Entra ID authority so the first OBO exchange skips the TCP and
+    TLS handshakes.
+    """
+    tenant = os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__TENANTID")
+    url = f"{AAD_AUTHORITY_HOST}/{tenant}/v2.0/.well-known/openid-configuration"
+    async with _get_http_session().get(url) as response:
+        await response.read()
+
+
+async def close_http_session() -> None:
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
 
+
+def token_expiry(token: str) -> Optional[float]:
+    """
+    Expiry (epoch seconds) from a JWT's exp claim, or None if the token doesn't carry one.
+    """
+    exp = _jwt_claims(token).get("exp")
+    return float(exp) if exp is not None else None
+
+
+def token_identity(token: str) -> str:
+    """
+    Stable key for the user behind a token: tenant + object id when the token carries them,
+    otherwise a hash of the token itself.
+    """
+    claims = _jwt_claims(token)
+    if claims.get("oid"):
+        return f"{claims.get('tid', '')}:{claims['oid']}"
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def _obo_exchange(passed_user_access_token: str, scope: str) -> tuple[str, int]:
+    """
+    Run the On-Behalf-Of exchange for the given scope. Returns the access token and its lifetime in seconds.
+    """
+    host = f'{AAD_AUTHORITY_HOST}/{os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__TENANTID")}/'
+    client_id = os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTID")
+    oauth_secret = os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTSECRET")
+    endpoint = 'oauth2/v2.0/token'
+    url = f'{host}{endpoint}'
+
+    data = {
+        "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
+        "scope": scope,
+        "requested_token_use": "on_behalf_of",
+        "assertion": passed_user_access_token,
+    }
+
+    auth = aiohttp.BasicAuth(client_id, oauth_secret)
+    with telemetry.phase("obo.exchange", scope=scope):
+        async with _get_http_session().post(url, data=data, auth=auth) as oauth_response:
+            oauth_response.raise_for_status()
+            payload = await oauth_response.json()
+
+    return payload["access_token"], int(payload.get("expires_in", 3600))
+
+
+def _store_token(key: tuple[str, str], access_token: str, expires_in: int, assertion: str) -> None:
+    _token_cache[key] = _CachedToken(access_token, time.time() + expires_in, assertion)
+    _token_cache.move_to_end(key)
+    while len(_token_cache) > OBO_TOKEN_CACHE_MAX_ENTRIES:
+        _token_cache.popitem(last=False)
+
+
+async def _refresh_token(key: tuple[str, str]) -> None:
+    entry = _token_cache.get(key)
+    if entry is None:
+        return
     try:
+        access_token, expires_in = await _obo_exchange(entry.assertion, key[1])
+        if key in _token_cache:
+            _store_token(key, access_token, expires_in, entry.assertion)
+    except Exception as e:
+        # The current token stays in place until it expires; the next call will retry in the foreground
+        logger.warning(f"Background OBO refresh failed: {e}")
+        entry.refreshing = False
+
+
+async def _get_obo_token(passed_user_access_token: str, scope: str) -> str:
+    """
+    Return a cached OBO token for the user and scope, exchanging a new one when the cache has none
+    that is still valid. Tokens close to expiry are returned and refreshed in the background.
+    """
+    key = (token_identity(passed_user_access_token), scope)
+    now = time.time()
 
-        # OBO exchange
-        host = f'https://login.microsoftonline.com/{os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__TENANTID")}/'
-        client_id = os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTID")
-        oauth_secret = os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTSECRET")
-        endpoint = 'oauth2/v2.0/token'
-        url = f'{host}{endpoint}'
-        DATABRICKS_RESOURCE = "2ff814a6-3304-4ab8-85cb-cd0e6f879c1d"
+    entry = _token_cache.get(key)
+    if entry and entry.expires_at - OBO_TOKEN_EXPIRY_SKEW_SECONDS > now:
+        _token_cache.move_to_end(key)
+        # Keep the freshest assertion around for background refreshes
+        entry.assertion = passed_user_access_token
+        if entry.expires_at - now < OBO_TOKEN_REFRESH_WINDOW_SECONDS and not entry.refreshing:
+            entry.refreshing = True
+            task = asyncio.create_task(_refresh_token(key))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+        return entry.access_token
 
-        data = {
-            "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
-            "scope": f"{DATABRICKS_RESOURCE}/.default",
-            "requested_token_use": "on_behalf_of",
-            "assertion": passed_user_access_token,
-        }
+    access_token, expires_in = await resilience.call_with_retry(
+        _obo_exchange, passed_user_access_token, scope, dependency="obo"
+    )
+    _store_token(key, access_token, expires_in, passed_user_access_token)
+    return access_token
 
-        auth = (client_id, oauth_secret)
-        oauth_response = requests.post(url, data=data, auth=auth)
-        oauth_response.raise_for_status()
 
-        adbtoken = oauth_response.json()["access_token"]
-        return adbtoken
+async def get_adb_token(passed_user_access_token: str) -> str:
+    """
+    Retrieve the Azure Databricks token via OBO using the Foundry project configuration.
+    Returns the ADB token string. The token is not stored globally; callers pass it along with the turn.
+    """
+    try:
+        return await _get_obo_token(passed_user_access_token, DATABRICKS_SCOPE)
 
     except Exception as e:
         logger.error(f"Get ADB token failed: {e}")
@@ -52,64 +223,174 @@ async def get_graph_token(passed_user_access_token: str) -> str:
     Acquire a Graph access token via OBO.
     """
     try:
-        host = f'https://login.microsoftonline.com/{os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__TENANTID")}/'
-        client_id = os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTID")
-        oauth_secret = os.getenv("CONNECTIONS__SERVICE_CONNECTION__SETTINGS__CLIENTSECRET")
-        endpoint = 'oauth2/v2.0/token'
-        url = f'{host}{endpoint}'
-
-        data = {
-            "grant_type": "urn:ietf:params:oauth:grant-type:jwt-bearer",
-            "scope": "https://graph.microsoft.com/.default",
-            "requested_token_use": "on_behalf_of",
-            "assertion": passed_user_access_token,
-        }
-
-        auth = (client_id, oauth_secret)
-        oauth_response = requests.post(url, data=data, auth=auth)
-        oauth_response.raise_for_status()
-
-        oauth_access_token = oauth_response.json()["access_token"]
-        return oauth_access_token
+        return await _get_obo_token(passed_user_access_token, GRAPH_SCOPE)
     except Exception as e:
         logger.error(f"Get Graph token failed: {e}")
         raise
 
 
-async def upload_blob_file(imagefilename: str, storageAcctName: str, storageContainerName: str, imagesDir: str) -> None:
+def _get_blob_service_client(storageAcctName: str) -> AsyncBlobServiceClient:
+    """
+    Shared async blob client per storage account, all built on one cached credential.
+    """
+    global _blob_credential
+
     account_url = f"https://{storageAcctName}.blob.core.windows.net"
-    container_name = storageContainerName
+    client = _blob_service_clients.get(account_url)
+    if client is None:
+        if _blob_credential is None:
+            # TODO: rework credential. May need to work via storage token on behalf of user
+            _blob_credential = AsyncDefaultAzureCredential(exclude_interactive_browser_credential=False)
+        client = AsyncBlobServiceClient(account_url, credential=_blob_credential)
+        _blob_service_clients[account_url] = client
+    return client
+
+
+async def warm_up_blob(storageAcctName: str) -> None:
+    """
+    Create the blob client and acquire its storage token ahead of the first chart upload.
+    """
+    _get_blob_service_client(storageAcctName)
+    await _blob_credential.get_token("https://storage.azure.com/.default")
 
-    # TODO: rework credential. May need to work via storage token on behalf of user
-    credential = DefaultAzureCredential(exclude_interactive_browser_credential=False)
-    blob_service_client = BlobServiceClient(account_url, credential=credential)
-    upload_file_path = os.path.join(imagesDir, imagefilename)
 
-    container_client = blob_service_client.get_container_client(container=container_name)
-    with open(file=upload_file_path, mode="rb") as data:
-        content_settings = ContentSettings(content_type="image/jpg")
-        container_client.upload_blob(name=imagefilename, data=data, content_settings=content_settings)
+async def close_blob_clients() -> None:
+    global _blob_credential
 
+    clients = list(_blob_service_clients.values())
+    _blob_service_clients.clear()
+    for client in clients:
+        await client.close()
+    if _blob_credential is not None:
+        await _blob_credential.close()
+        _blob_credential = None
 
-async def del_blob_file(imagefilename: str, storageAcctName: str, storageContainerName: str) -> None:
+
+def content_blob_name(data: bytes, prefix: str = "chart_", extension: str = ".png") -> str:
+    """
+    Content-addressed blob name: identical images map to the same blob.
+    """
+    return f"{prefix}{hashlib.sha256(data).hexdigest()}{extension}"
+
+
+async def upload_blob_data(imagefilename: str, data: bytes, storageAcctName: str, storageContainerName: str, content_type: str = "image/png") -> bool:
+    """
+    Upload in-memory bytes as a blob, skipping the upload when a blob of that name already exists.
+    Use with content_blob_name so an existing blob always holds the same bytes. An existing blob has
+    its metadata touched, which moves its last-modified time so the sweeper keeps charts in use.
+    Returns True when the data was uploaded.
+    """
+    container_client = _get_blob_service_client(storageAcctName).get_container_client(container=storageContainerName)
+    content_settings = ContentSettings(content_type=content_type)
     try:
-        account_url = f"https://{storageAcctName}.blob.core.windows.net"
-        container_name = storageContainerName
+        await container_client.upload_blob(name=imagefilename, data=data, content_settings=content_settings, overwrite=False)
+        return True
+    except ResourceExistsError:
+        blob_client = container_client.get_blob_client(blob=imagefilename)
+        await blob_client.set_blob_metadata({"last_used": datetime.now(timezone.utc).isoformat()})
+        return False
 
-        # TODO: rework credential. May need to work via storage token on behalf of user
-        credential = DefaultAzureCredential(exclude_interactive_browser_credential=False)
-        blob_service_client = BlobServiceClient(account_url, credential=credential)
-        container_client = blob_service_client.get_container_client(container=container_name)
+
+async def _get_user_delegation_key(storageAcctName: str) -> UserDelegationKey:
+    now = datetime.now(timezone.utc)
+    cached = _user_delegation_keys.get(storageAcctName)
+    # Refresh before the key stops outliving the SAS tokens signed with it
+    if cached is None or cached[1] < now + timedelta(minutes=CHART_SAS_TTL_MINUTES + 5):
+        expires_at = now + USER_DELEGATION_KEY_LIFETIME
+        key = await _get_blob_service_client(storageAcctName).get_user_delegation_key(
+            key_start_time=now - timedelta(minutes=5),
+            key_expiry_time=expires_at,
+        )
+        cached = (key, expires_at)
+        _user_delegation_keys[storageAcctName] = cached
+    return cached[0]
+
+
+async def get_blob_url(imagefilename: str, storageAcctName: str, storageContainerName: str) -> str:
+    """
+    URL for a blob. When CHART_SAS_TTL_MINUTES is set this carries a read-only user delegation SAS;
+    if one can't be issued the plain blob URL is returned.
+    """
+    blob_url = f"https://{storageAcctName}.blob.core.windows.net/{storageContainerName}/{imagefilename}"
+    if CHART_SAS_TTL_MINUTES <= 0:
+        return blob_url
+
+    try:
+        now = datetime.now(timezone.utc)
+        sas = generate_blob_sas(
+            account_name=storageAcctName,
+            container_name=storageContainerName,
+            blob_name=imagefilename,
+            user_delegation_key=await _get_user_delegation_key(storageAcctName),
+            permission=BlobSasPermissions(read=True),
+            start=now - timedelta(minutes=5),
+            expiry=now + timedelta(minutes=CHART_SAS_TTL_MINUTES),
+        )
+        return f"{blob_url}?{sas}"
+    except Exception as e:
+        logger.warning(f"Could not issue SAS for blob {imagefilename}, using plain URL: {e}")
+        return blob_url
+
+
+async def del_blob_file(imagefilename: str, storageAcctName: str, storageContainerName: str) -> bool:
+    """
+    Delete a blob. A blob that is already gone counts as deleted; returns False in that case.
+    """
+    try:
+        container_client = _get_blob_service_client(storageAcctName).get_container_client(container=storageContainerName)
         blob_client = container_client.get_blob_client(blob=imagefilename)
-        blob_client.delete_blob()
+        await blob_client.delete_blob()
+        return True
+    except ResourceNotFoundError:
+        # Already deleted, e.g. by the sweeper of another replica
+        return False
     except Exception as e:
         logger.error(f"Error deleting blob: {e}")
         raise
 
 
+async def sweep_expired_blobs(storageAcctName: str, storageContainerName: str, max_age: timedelta, prefix: str = "chart_") -> int:
+    """
+    Delete blobs under prefix that haven't been written or reused for longer than max_age.
+    Returns the number of blobs deleted.
+    """
+    container_client = _get_blob_service_client(storageAcctName).get_container_client(container=storageContainerName)
+    cutoff = datetime.now(timezone.utc) - max_age
+    removed = 0
+    async for blob in container_client.list_blobs(name_starts_with=prefix):
+        if blob.last_modified and blob.last_modified < cutoff:
+            if await del_blob_file(blob.name, storageAcctName, storageContainerName):
+                removed += 1
+    return removed
+
+
+async def run_blob_sweeper(storageAcctName: str, storageContainerName: str, max_age: timedelta, interval: timedelta) -> None:
+    """
+    Background loop expiring old chart blobs every interval until cancelled.
+    """
+    while True:
+        try:
+            removed = await sweep_expired_blobs(storageAcctName, storageContainerName, max_age)
+            if removed:
+                logger.info(f"Blob sweeper deleted {removed} expired chart images")
+        except Exception as e:
+            logger.warning(f"Blob sweep failed: {e}")
+        await asyncio.sleep(interval.total_seconds())
+
+
 __all__ = [
     "get_adb_token",
     "get_graph_token",
-    "upload_blob_file",
-    "del_blob_file"
+    "close_http_session",
+    "warm_up_blob",
+    "warm_up_http",
+    "token_expiry",
+    "token_identity",
+    "close_blob_clients",
+    "content_blob_name",
+    "upload_blob_data",
+    "get_blob_url",
+    "del_blob_file",
+    "sweep_expired_blobs",
+    "run_blob_sweeper"
 ]
\ No newline at end of file
@@ -0,0 +1,59 @@
+import asyncio
+
+import utils
+from agents import genie_charts as charts
+from agents import genie_tools as tools
+from agents.genie_cache import GenieResultCache
+from agents.genie_datasets import GenieDataset, GenieDatasetStore
+
+SPACE_ID = "0" * 31 + "1"
+QUESTION = "Revenue by month?"
+TOKEN = "token-of-one-user"
+
+
+def _dataset() -> GenieDataset:
+    return GenieDataset(
+        columns=["month", "revenue"],
+        types=["STRING", "DECIMAL"],
+        rows=[["2026-01", "10.5"], ["2026-02", "12"], ["2026-03", "9.25"]],
+    )
+
+
+def _ask() -> dict:
+    return asyncio.run(tools.ask_genie_result(QUESTION, None, SPACE_ID, TOKEN))
+
+
+def test_cache_hit_can_be_charted_after_its_dataset_left_the_store(monkeypatch):
+    result_cache = GenieResultCache(ttl_seconds=300, max_entries=10)
+    dataset_store = GenieDatasetStore(ttl_seconds=900, max_entries=1, max_rows=1000)
+    monkeypatch.setattr(tools, "result_cache", result_cache)
+    monkeypatch.setattr(tools, "dataset_store", dataset_store)
+
+    identity = utils.token_identity(TOKEN)
+    table = {"columns": ["month", "revenue"], "types": ["STRING", "DECIMAL"], "values": [[], []], "row_count": 3}
+    result_cache.put(SPACE_ID, QUESTION, identity, {"conversation_id": "c1", "table": table, "dataset_id": "old"}, _dataset())
+
+    first = _ask()
+    assert first["table"] == table
+    assert "conversation_id" not in first
+    assert first["dataset_id"] != "old"
+
+    # Another result takes the store's only slot; the next hit stores the cached rows again
+    dataset_store.put(identity, GenieDataset(columns=["x"], types=["STRING"], rows=[["a"]]))
+    assert dataset_store.get(first["dataset_id"], identity) is None
+
+    second = _ask()
+    dataset = dataset_store.get(second["dataset_id"], identity)
+    assert dataset is not None and dataset.rows == _dataset().rows
+    assert dataset_store.get(second["dataset_id"], "someone-else") is None
+
+    png = charts.render_png(*charts.chart_args(dataset, "line", "month", ["revenue"], "Revenue by month"))
+    assert png.startswith(b"\x89PNG")
+
+
+def test_cache_hit_without_dataset_has_no_dataset_id(monkeypatch):
+    result_cache = GenieResultCache(ttl_seconds=300, max_entries=10)
+    monkeypatch.setattr(tools, "result_cache", result_cache)
+    result_cache.put(SPACE_ID, QUESTION, utils.token_identity(TOKEN), {"message": "No data for that month."})
+
+    assert _ask() == {"message": "No data for that month."}
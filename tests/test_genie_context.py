@@ -0,0 +1,33 @@
+from agent_framework import AgentRunResponseUpdate, FunctionCallContent, Role, TextContent, UsageContent, UsageDetails
+
+from agents import genie_context as context
+from agents.genie_agent import ConversationSession
+
+
+def _usage(input_tokens: int) -> AgentRunResponseUpdate:
+    return AgentRunResponseUpdate(role=Role.ASSISTANT, contents=[UsageContent(details=UsageDetails(input_token_count=input_tokens))])
+
+
+def test_input_tokens_is_the_largest_step_of_a_multi_step_run():
+    # Tool call, code interpreter and answer steps, each reading the thread so far
+    updates = [
+        AgentRunResponseUpdate(role=Role.ASSISTANT, contents=[FunctionCallContent(call_id="1", name="ask_genie_ai_function", arguments={})]),
+        _usage(6000),
+        _usage(9000),
+        AgentRunResponseUpdate(role=Role.ASSISTANT, contents=[TextContent(text="Revenue grew.")]),
+        _usage(11000),
+    ]
+    assert context.input_tokens(updates) == 11000
+
+
+def test_input_tokens_without_usage():
+    assert context.input_tokens([AgentRunResponseUpdate(role=Role.ASSISTANT, contents=[TextContent(text="Hi")])]) is None
+
+
+def test_multi_step_run_within_budget_keeps_its_thread():
+    steps = [_usage(context.CONTEXT_TOKEN_BUDGET // 2)] * 3
+    session = ConversationSession(thread_id="thread", thread_turns=1, context_tokens=context.input_tokens(steps))
+    assert not context.needs_rollover(session)
+
+    session.context_tokens = context.input_tokens([_usage(context.CONTEXT_TOKEN_BUDGET + 1)])
+    assert context.needs_rollover(session)
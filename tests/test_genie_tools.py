@@ -0,0 +1,40 @@
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from agents import genie_tools as tools
+
+
+class _Session:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _client() -> SimpleNamespace:
+    return SimpleNamespace(api_client=SimpleNamespace(_api_client=SimpleNamespace(_session=_Session())))
+
+
+def _session(client) -> _Session:
+    return client.api_client._api_client._session
+
+
+def test_evicted_clients_have_their_sessions_closed(monkeypatch):
+    expired, oldest, newest = _client(), _client(), _client()
+    cache = OrderedDict(
+        expired=(expired, None, 50.0),
+        oldest=(oldest, None, 500.0),
+        newest=(newest, None, 500.0),
+    )
+    monkeypatch.setattr(tools, "_client_cache", cache)
+    monkeypatch.setattr(tools, "GENIE_CLIENT_CACHE_MAX_ENTRIES", 1)
+
+    tools._evict_clients(100.0)
+
+    assert list(cache) == ["newest"]
+    assert _session(expired).closed and _session(oldest).closed
+    assert not _session(newest).closed
+
+    tools.close_clients()
+    assert not cache and _session(newest).closed
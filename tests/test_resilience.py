@@ -0,0 +1,81 @@
+import time
+import asyncio
+
+import pytest
+
+import resilience
+from resilience import CircuitBreaker, CircuitOpenError
+
+
+def _half_open_breaker(name: str) -> CircuitBreaker:
+    breaker = resilience._breakers[name] = CircuitBreaker(name, failure_threshold=1, reset_seconds=30)
+    breaker._failures = 1
+    breaker._opened_at = time.monotonic() - 60
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_cancelled_trial_call_frees_the_half_open_slot():
+    breaker = _half_open_breaker("test.cancelled_trial")
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        trial = asyncio.create_task(resilience.call_with_retry(hang, dependency=breaker.name))
+        await started.wait()
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        async def succeed():
+            return "ok"
+
+        # The next call gets the trial slot and closes the breaker
+        return await resilience.call_with_retry(succeed, dependency=breaker.name)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_trial_call_cancelled_by_the_deadline_frees_the_half_open_slot():
+    breaker = _half_open_breaker("test.deadline_trial")
+
+    async def scenario():
+        async def hang():
+            await asyncio.sleep(60)
+
+        with resilience.deadline(1):
+            await asyncio.wait_for(resilience.call_with_retry(hang, dependency=breaker.name), 0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(scenario())
+    assert breaker.state == "half_open"
+    breaker.before_call()
+    assert breaker._trial_in_flight
+
+
+def test_interrupted_sync_trial_call_frees_the_half_open_slot():
+    breaker = _half_open_breaker("test.sync_trial")
+
+    def interrupt():
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        resilience.call_with_retry_sync(interrupt, dependency=breaker.name)
+    assert resilience.call_with_retry_sync(lambda: "ok", dependency=breaker.name) == "ok"
+    assert breaker.state == "closed"
+
+
+def test_half_open_breaker_fails_fast_while_a_trial_runs():
+    breaker = _half_open_breaker("test.open")
+    breaker.before_call()
+
+    async def succeed():
+        return "ok"
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilience.call_with_retry(succeed, dependency=breaker.name))